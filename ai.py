@@ -2,12 +2,14 @@ from __future__ import annotations
 
 import json
 import logging
-from statistics import median
 from datetime import datetime
 import os
 from typing import Any
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
+from sqlalchemy import and_, bindparam, case, func, literal, null, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Session, select
 
 from models import (
@@ -20,7 +22,74 @@ from models import (
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI()
+client = AsyncOpenAI(timeout=httpx.Timeout(30.0, connect=5.0), max_retries=2)
+
+_INSIGHTS_INSTRUCTIONS = (
+    "You are a pricing and negotiation coach for content creators. You will be "
+    "given aggregated stats about one creator's sponsorship deals, pricing "
+    "recommendations, and negotiation outcomes. You must return:\n"
+    "1) 3-5 bullet-point insights about how they are currently pricing and "
+    "performing (be specific and numeric where possible).\n"
+    "2) 3 concrete action recommendations for the next 30 days, tailored to "
+    "their main platform and niche.\n"
+    "Avoid generic advice, and only reference patterns that are actually "
+    "supported by the stats. If the data is thin, acknowledge that explicitly."
+)
+
+_NICHE_REPORT_INSTRUCTIONS = (
+    "You are an analyst for a tool that helps content creators price brand deals. "
+    "Given quarterly aggregated deal stats for a specific niche and platform, write "
+    "a concise report with: (1) a summary of typical deal sizes and CPMs, "
+    "(2) how this quarter compares to the previous quarter if data is available, "
+    "and (3) 3–5 practical recommendations for creators in this niche. Avoid generic "
+    "advice; base everything on the numbers."
+)
+
+# Returned when the niche report call fails; callers should not cache it.
+NICHE_REPORT_UNAVAILABLE = (
+    "We couldn’t generate a full AI report right now. Here are the raw numbers instead."
+)
+
+_PRICING_INSTRUCTIONS = (
+    "You are a pricing assistant for creators. Write a single, concise paragraph "
+    "explaining the recommended rate. Requirements:\n"
+    "- 1 paragraph, 1-3 sentences, no lists.\n"
+    "- Include platform, niche, and deal type explicitly.\n"
+    "- Include the recommended price and range, with the recommended price wrapped "
+    "in <strong> tags.\n"
+    "- Mention base CPM and the effective CPM after multipliers.\n"
+    "- If follower count or avg views are unusually low or high, briefly mention it.\n"
+    "- No extra formatting beyond <strong> tags."
+)
+
+
+async def _stream_output_text(**kwargs: Any) -> str:
+    stream = await client.responses.create(stream=True, **kwargs)
+    chunks: list[str] = []
+    completed = False
+    # Closing the stream releases the pooled connection when an event raises.
+    async with stream:
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                chunks.append(event.delta)
+            elif event.type == "response.completed":
+                completed = True
+            elif event.type == "error":
+                raise RuntimeError(f"OpenAI stream error: {event.message}")
+            elif event.type == "response.failed":
+                error = event.response.error
+                message = error.message if error else "unknown error"
+                raise RuntimeError(f"OpenAI response failed: {message}")
+            elif event.type == "response.incomplete":
+                details = event.response.incomplete_details
+                reason = details.reason if details else "unknown"
+                raise RuntimeError(f"OpenAI response incomplete: {reason}")
+    output_text = "".join(chunks)
+    if not completed:
+        raise RuntimeError("OpenAI stream ended before the response completed")
+    if not output_text.strip():
+        raise RuntimeError("OpenAI response had no output text")
+    return output_text
 
 
 def calculator_ai_enabled() -> bool:
@@ -32,6 +101,27 @@ def calculator_ai_enabled() -> bool:
     }
 
 
+_ai_usage = AiUsage.__table__
+
+# Insert today's row or bump its counter in one statement; the WHERE on the
+# conflict branch enforces the cap, so no row comes back once it is reached.
+_RESERVE_AI_CALL = (
+    sqlite_insert(_ai_usage)
+    .values(
+        usage_date=bindparam("usage_date"),
+        feature=bindparam("feature"),
+        call_count=1,
+        created_at=bindparam("created_at"),
+    )
+    .on_conflict_do_update(
+        index_elements=[_ai_usage.c.usage_date, _ai_usage.c.feature],
+        set_={"call_count": _ai_usage.c.call_count + 1},
+        where=_ai_usage.c.call_count < bindparam("cap"),
+    )
+    .returning(_ai_usage.c.call_count)
+)
+
+
 def reserve_calculator_ai_call(
     session: Session, feature: str = "calculator", daily_cap: int | None = None
 ) -> bool:
@@ -44,55 +134,95 @@ def reserve_calculator_ai_call(
     if cap <= 0:
         return False
 
-    usage_date = datetime.utcnow().date().isoformat()
-    statement = select(AiUsage).where(
-        AiUsage.usage_date == usage_date, AiUsage.feature == feature
-    )
-    usage_row = session.exec(statement).first()
-    if not usage_row:
-        usage_row = AiUsage(usage_date=usage_date, feature=feature, call_count=0)
-        session.add(usage_row)
-        session.commit()
-        session.refresh(usage_row)
-
-    if usage_row.call_count >= cap:
-        return False
-
-    usage_row.call_count += 1
-    session.add(usage_row)
+    now = datetime.utcnow()
+    reserved = session.exec(
+        _RESERVE_AI_CALL,
+        params={
+            "usage_date": now.date().isoformat(),
+            "feature": feature,
+            "created_at": now,
+            "cap": cap,
+        },
+    ).first()
     session.commit()
-    return True
-
-
-def _safe_median(values: list[float]) -> float | None:
-    if not values:
-        return None
-    return float(median(values))
+    return reserved is not None
 
 
-def _safe_avg(values: list[float]) -> float | None:
-    if not values:
-        return None
-    return float(sum(values) / len(values))
+def _deal_rollup(
+    session: Session, user_id: int
+) -> dict[tuple[str, str], dict[str, Any]]:
+    fee = DealContribution.total_fee_usd
+    cpm = case(
+        (
+            and_(DealContribution.reported_views > 0, fee != 0),
+            (fee / DealContribution.reported_views) * 1000,
+        )
+    )
+    user_deals = DealContribution.user_id == user_id
+
+    # One UNION ALL tags every deal as an overall row plus its platform and niche
+    # rows, so all three rollups (medians included) come back in one round-trip.
+    # CPM is only reported overall, so the bucket rows skip the division.
+    tagged = union_all(
+        select(
+            literal("all").label("kind"),
+            literal("").label("bucket"),
+            fee.label("fee"),
+            cpm.label("cpm"),
+        ).where(user_deals),
+        select(literal("platform"), DealContribution.platform, fee, null()).where(
+            user_deals,
+            DealContribution.platform.is_not(None),
+            DealContribution.platform != "",
+        ),
+        select(literal("niche"), DealContribution.niche, fee, null()).where(
+            user_deals,
+            DealContribution.niche.is_not(None),
+            DealContribution.niche != "",
+        ),
+    ).subquery()
+    partition = [tagged.c.kind, tagged.c.bucket]
+    ranked = select(
+        tagged,
+        func.row_number().over(partition_by=partition, order_by=tagged.c.fee).label("rn"),
+        func.count().over(partition_by=partition).label("cnt"),
+    ).subquery()
+    middle = and_(ranked.c.rn * 2 >= ranked.c.cnt, ranked.c.rn * 2 <= ranked.c.cnt + 2)
+
+    rows = session.exec(
+        select(
+            ranked.c.kind,
+            ranked.c.bucket,
+            func.count(),
+            func.avg(ranked.c.fee),
+            func.avg(case((middle, ranked.c.fee))),
+            func.avg(ranked.c.cpm),
+        ).group_by(ranked.c.kind, ranked.c.bucket)
+    ).all()
 
+    rollup: dict[tuple[str, str], dict[str, Any]] = {}
+    for kind, bucket, count, avg_fee, median_fee, avg_cpm in rows:
+        rollup[(kind, bucket)] = {
+            "count": count,
+            "avg_fee": float(avg_fee) if avg_fee is not None else None,
+            "median_fee": float(median_fee) if median_fee is not None else None,
+            "avg_cpm": float(avg_cpm) if avg_cpm is not None else None,
+        }
+    return rollup
 
-def _fees_by_key(rows: list[DealContribution], key: str) -> dict[str, dict[str, Any]]:
-    buckets: dict[str, list[float]] = {}
-    for row in rows:
-        value = getattr(row, key)
-        if not value:
-            continue
-        buckets.setdefault(value, []).append(float(row.total_fee_usd or 0))
 
-    summary: dict[str, dict[str, Any]] = {}
-    for bucket, fees in buckets.items():
-        fees_sorted = sorted(fees)
-        summary[bucket] = {
-            "count": len(fees_sorted),
-            "avg_fee": _safe_avg(fees_sorted),
-            "median_fee": _safe_median(fees_sorted),
+def _fees_by_key(
+    rollup: dict[tuple[str, str], dict[str, Any]], kind: str
+) -> dict[str, dict[str, Any]]:
+    return {
+        bucket: {
+            "count": summary["count"],
+            "avg_fee": summary["avg_fee"],
+            "median_fee": summary["median_fee"],
         }
-    return summary
+        for (row_kind, bucket), summary in rollup.items()
+        if row_kind == kind
+    }
 
 
 def build_creator_stats(session: Session, user_id: int) -> dict[str, Any]:
@@ -100,82 +230,77 @@ def build_creator_stats(session: Session, user_id: int) -> dict[str, Any]:
         select(CreatorProfile).where(CreatorProfile.user_id == user_id)
     ).first()
 
-    deals = session.exec(
-        select(DealContribution).where(DealContribution.user_id == user_id)
-    ).all()
-
-    negotiations = session.exec(
-        select(NegotiationSession).where(NegotiationSession.user_id == user_id)
-    ).all()
-
-    calculations = session.exec(
-        select(Calculation).where(Calculation.user_id == user_id)
-    ).all()
-
-    deal_fees = [float(d.total_fee_usd) for d in deals if d.total_fee_usd is not None]
-    deal_fees_sorted = sorted(deal_fees)
-    avg_deal = _safe_avg(deal_fees_sorted)
-    median_deal = _safe_median(deal_fees_sorted)
-
-    cpms = []
-    for row in deals:
-        if row.reported_views and row.reported_views > 0 and row.total_fee_usd:
-            cpms.append((row.total_fee_usd / row.reported_views) * 1000)
-
-    negotiation_offer_diffs = [
-        n.offer_vs_market_pct for n in negotiations if n.offer_vs_market_pct is not None
-    ]
-    avg_offer_diff = _safe_avg([float(x) for x in negotiation_offer_diffs])
-
-    counter_above_offer = 0
-    for n in negotiations:
-        if n.recommended_counter_min is None or n.brand_offer is None:
-            continue
-        if n.recommended_counter_min > n.brand_offer:
-            counter_above_offer += 1
-
-    calc_ranges: dict[tuple[str, str], list[tuple[float, float]]] = {}
-    for calc in calculations:
-        key = (calc.platform, calc.niche)
-        calc_ranges.setdefault(key, []).append(
-            (float(calc.recommended_min), float(calc.recommended_max))
+    rollup = _deal_rollup(session, user_id)
+    overall = rollup.get(("all", "")) or {
+        "count": 0,
+        "avg_fee": None,
+        "median_fee": None,
+        "avg_cpm": None,
+    }
+    deal_count = overall["count"]
+
+    negotiation_count, avg_offer_diff, counter_above_offer = session.exec(
+        select(
+            func.count(),
+            func.avg(NegotiationSession.offer_vs_market_pct),
+            func.count(
+                case(
+                    (
+                        NegotiationSession.recommended_counter_min
+                        > NegotiationSession.brand_offer,
+                        1,
+                    )
+                )
+            ),
+        ).where(NegotiationSession.user_id == user_id)
+    ).one()
+
+    calc_ranges = session.exec(
+        select(
+            Calculation.platform,
+            Calculation.niche,
+            func.count(),
+            func.avg(Calculation.recommended_min),
+            func.avg(Calculation.recommended_max),
         )
-
-    main_calc_key = None
-    if calc_ranges:
-        main_calc_key = max(calc_ranges.items(), key=lambda item: len(item[1]))[0]
+        .where(Calculation.user_id == user_id)
+        .group_by(Calculation.platform, Calculation.niche)
+        .order_by(func.count().desc(), func.min(Calculation.id))
+    ).all()
+    calculation_count = sum(row[2] for row in calc_ranges)
 
     typical_range = None
-    if main_calc_key:
-        mins = [pair[0] for pair in calc_ranges[main_calc_key]]
-        maxes = [pair[1] for pair in calc_ranges[main_calc_key]]
+    if calc_ranges:
+        platform, niche, _, avg_min, avg_max = calc_ranges[0]
         typical_range = {
-            "platform": main_calc_key[0],
-            "niche": main_calc_key[1],
-            "avg_min": _safe_avg(mins),
-            "avg_max": _safe_avg(maxes),
+            "platform": platform,
+            "niche": niche,
+            "avg_min": float(avg_min),
+            "avg_max": float(avg_max),
         }
 
     deal_summary = {
-        "total_deals": len(deals),
-        "count": len(deals),
-        "avg_fee": avg_deal,
-        "median_fee": median_deal,
-        "avg_cpm": _safe_avg(cpms),
-        "platform_breakdown": _fees_by_key(deals, "platform"),
-        "niche_breakdown": _fees_by_key(deals, "niche"),
+        "total_deals": deal_count,
+        "count": deal_count,
+        "avg_fee": overall["avg_fee"],
+        "median_fee": overall["median_fee"],
+        "avg_cpm": overall["avg_cpm"],
+        "platform_breakdown": _fees_by_key(rollup, "platform"),
+        "niche_breakdown": _fees_by_key(rollup, "niche"),
     }
 
     negotiation_summary = {
-        "total_negotiations": len(negotiations),
-        "count": len(negotiations),
-        "avg_offer_vs_market_pct": avg_offer_diff,
+        "total_negotiations": negotiation_count,
+        "count": negotiation_count,
+        "avg_offer_vs_market_pct": (
+            float(avg_offer_diff) if avg_offer_diff is not None else None
+        ),
         "counter_above_offer_count": counter_above_offer,
     }
 
     calculator_summary = {
-        "total_calculations": len(calculations),
-        "count": len(calculations),
+        "total_calculations": calculation_count,
+        "count": calculation_count,
         "typical_range": typical_range,
     }
 
@@ -190,11 +315,11 @@ def build_creator_stats(session: Session, user_id: int) -> dict[str, Any]:
             "engagement_rate": profile.engagement_rate,
         }
 
-    total_signals = len(deals) + len(negotiations) + len(calculations)
+    total_signals = deal_count + negotiation_count + calculation_count
     data_richness = {
-        "has_any_deals": len(deals) > 0,
-        "has_any_negotiations": len(negotiations) > 0,
-        "has_any_calculations": len(calculations) > 0,
+        "has_any_deals": deal_count > 0,
+        "has_any_negotiations": negotiation_count > 0,
+        "has_any_calculations": calculation_count > 0,
         "total_signals": total_signals,
     }
 
@@ -207,7 +332,7 @@ def build_creator_stats(session: Session, user_id: int) -> dict[str, Any]:
     }
 
 
-def generate_creator_insights(
+async def generate_creator_insights(
     stats: dict[str, Any], preview: bool = False
 ) -> dict[str, Any]:
     total_signals = (stats.get("data_richness") or {}).get("total_signals", 0)
@@ -222,18 +347,6 @@ def generate_creator_insights(
         }
 
     try:
-        instructions = (
-            "You are a pricing and negotiation coach for content creators. You will be "
-            "given aggregated stats about one creator's sponsorship deals, pricing "
-            "recommendations, and negotiation outcomes. You must return:\n"
-            "1) 3-5 bullet-point insights about how they are currently pricing and "
-            "performing (be specific and numeric where possible).\n"
-            "2) 3 concrete action recommendations for the next 30 days, tailored to "
-            "their main platform and niche.\n"
-            "Avoid generic advice, and only reference patterns that are actually "
-            "supported by the stats. If the data is thin, acknowledge that explicitly."
-        )
-
         input_payload = {
             "profile": stats.get("profile"),
             "deal_summary": stats.get("deal_summary"),
@@ -243,15 +356,17 @@ def generate_creator_insights(
             "preview": preview,
         }
 
-        response = client.responses.create(
+        output_text = await _stream_output_text(
             model="gpt-5.2",
-            instructions=instructions,
+            instructions=_INSIGHTS_INSTRUCTIONS,
             input=json.dumps(input_payload, ensure_ascii=False),
+            reasoning={"effort": "low"},
+            max_output_tokens=2000,
         )
         return {
             "status": "ok",
             "message": "",
-            "insights_text": response.output_text.strip(),
+            "insights_text": output_text.strip(),
         }
     except Exception:
         logger.exception("OpenAI insights generation failed")
@@ -265,7 +380,7 @@ def generate_creator_insights(
         }
 
 
-def generate_niche_report(stats: dict[str, Any]) -> str:
+async def generate_niche_report(stats: dict[str, Any]) -> str:
     min_deals = stats.get("min_deals_for_report", 5)
     deal_count = stats.get("deal_count", 0)
     if deal_count < min_deals or not stats.get("enough_data_for_report", False):
@@ -276,28 +391,20 @@ def generate_niche_report(stats: dict[str, Any]) -> str:
         )
 
     try:
-        instructions = (
-            "You are an analyst for a tool that helps content creators price brand deals. "
-            "Given quarterly aggregated deal stats for a specific niche and platform, write "
-            "a concise report with: (1) a summary of typical deal sizes and CPMs, "
-            "(2) how this quarter compares to the previous quarter if data is available, "
-            "and (3) 3–5 practical recommendations for creators in this niche. Avoid generic "
-            "advice; base everything on the numbers."
-        )
-        response = client.responses.create(
+        output_text = await _stream_output_text(
             model="gpt-5.2",
-            instructions=instructions,
+            instructions=_NICHE_REPORT_INSTRUCTIONS,
             input=json.dumps(stats, ensure_ascii=False),
+            reasoning={"effort": "low"},
+            max_output_tokens=3000,
         )
-        return response.output_text.strip()
+        return output_text.strip()
     except Exception:
         logger.exception("OpenAI niche report generation failed")
-        return (
-            "We couldn’t generate a full AI report right now. Here are the raw numbers instead."
-        )
+        return NICHE_REPORT_UNAVAILABLE
 
 
-def generate_pricing_explanation(
+async def generate_pricing_explanation(
     platform: str,
     niche: str,
     deal_type: str,
@@ -314,18 +421,6 @@ def generate_pricing_explanation(
     low_price: float,
     high_price: float,
 ) -> str:
-    instructions = (
-        "You are a pricing assistant for creators. Write a single, concise paragraph "
-        "explaining the recommended rate. Requirements:\n"
-        "- 1 paragraph, 1-3 sentences, no lists.\n"
-        "- Include platform, niche, and deal type explicitly.\n"
-        "- Include the recommended price and range, with the recommended price wrapped "
-        "in <strong> tags.\n"
-        "- Mention base CPM and the effective CPM after multipliers.\n"
-        "- If follower count or avg views are unusually low or high, briefly mention it.\n"
-        "- No extra formatting beyond <strong> tags."
-    )
-
     payload = {
         "platform": platform,
         "niche": niche,
@@ -344,11 +439,11 @@ def generate_pricing_explanation(
         "high_price": high_price,
     }
 
-    response = client.responses.create(
+    output_text = await _stream_output_text(
         model="gpt-4o-mini",
-        instructions=instructions,
+        instructions=_PRICING_INSTRUCTIONS,
         input=json.dumps(payload, ensure_ascii=False),
         max_output_tokens=140,
         temperature=0.2,
     )
-    return response.output_text.strip()
+    return output_text.strip()
@@ -1,122 +1,108 @@
 from __future__ import annotations
 
 from datetime import datetime
-from statistics import median
 from typing import Any
 
+from sqlalchemy import and_, case, func
 from sqlmodel import Session, select
 
 from constants import PLATFORM_LABELS, DEAL_TYPE_LABELS
 from models import DealContribution, NegotiationSession
-from stats_helpers import summarize_cpm_outlier_safe, summarize_fees_outlier_safe
-
-
-def _safe_avg(values: list[float]) -> float | None:
-    if not values:
-        return None
-    return float(sum(values) / len(values))
-
-
-def _safe_median(values: list[float]) -> float | None:
-    if not values:
-        return None
-    return float(median(values))
+from stats_helpers import (
+    fees_and_views,
+    median_by_group,
+    summarize_cpm_outlier_safe,
+    summarize_fees_outlier_safe,
+)
+
+
+def _fee_breakdown(
+    session: Session, user_id: int, column, key: str, labels: dict[str, str]
+) -> list[dict[str, Any]]:
+    rows = session.exec(
+        select(column, func.count(), func.avg(DealContribution.total_fee_usd))
+        .where(DealContribution.user_id == user_id, column.is_not(None), column != "")
+        .group_by(column)
+        .order_by(column)
+    ).all()
+    return [
+        {
+            key: code,
+            "label": labels.get(code, "Other"),
+            "count": count,
+            "avg_fee": float(avg_fee) if avg_fee is not None else None,
+        }
+        for code, count, avg_fee in rows
+    ]
 
 
 def build_user_analytics(session: Session, user_id: int) -> dict[str, Any]:
-    deals = session.exec(
-        select(DealContribution).where(DealContribution.user_id == user_id)
-    ).all()
-    negotiations = session.exec(
-        select(NegotiationSession).where(NegotiationSession.user_id == user_id)
+    negotiation_outcomes = session.exec(
+        select(NegotiationSession.outcome).where(NegotiationSession.user_id == user_id)
     ).all()
 
-    deal_fees = [float(d.total_fee_usd) for d in deals if d.total_fee_usd is not None]
-    deal_fees_sorted = sorted(deal_fees)
-
-    quoted_rows = [
-        d
-        for d in deals
-        if d.quoted_fee_usd is not None
-        and d.quoted_fee_usd > 0
-        and d.total_fee_usd is not None
-    ]
-    quoted_fees = [float(d.quoted_fee_usd) for d in quoted_rows]
-    closed_fees = [float(d.total_fee_usd) for d in quoted_rows]
-    close_vs_quote = [
-        ((float(d.total_fee_usd) - float(d.quoted_fee_usd)) / float(d.quoted_fee_usd))
-        * 100
-        for d in quoted_rows
-    ]
-
-    platform_buckets: dict[str, list[float]] = {}
-    deal_type_buckets: dict[str, list[float]] = {}
-    for deal in deals:
-        if deal.platform:
-            platform_buckets.setdefault(deal.platform, []).append(float(deal.total_fee_usd))
-        if deal.deal_type:
-            deal_type_buckets.setdefault(deal.deal_type, []).append(float(deal.total_fee_usd))
-
-    platform_breakdown = []
-    for code, fees in sorted(platform_buckets.items()):
-        fees_sorted = sorted(fees)
-        platform_breakdown.append(
-            {
-                "platform": code,
-                "label": PLATFORM_LABELS.get(code, "Other"),
-                "count": len(fees_sorted),
-                "avg_fee": _safe_avg(fees_sorted),
-            }
-        )
-
-    deal_type_breakdown = []
-    for code, fees in sorted(deal_type_buckets.items()):
-        fees_sorted = sorted(fees)
-        deal_type_breakdown.append(
-            {
-                "deal_type": code,
-                "label": DEAL_TYPE_LABELS.get(code, "Other"),
-                "count": len(fees_sorted),
-                "avg_fee": _safe_avg(fees_sorted),
-            }
-        )
+    fee = DealContribution.total_fee_usd
+    quoted = DealContribution.quoted_fee_usd
+    is_quoted = and_(quoted > 0, fee.is_not(None))
+    (
+        deals_count,
+        total_revenue,
+        avg_deal,
+        quoted_count,
+        avg_quoted_fee,
+        avg_closed_fee,
+        avg_close_vs_quote,
+    ) = session.exec(
+        select(
+            func.count(),
+            func.sum(fee),
+            func.avg(fee),
+            func.count(case((is_quoted, 1))),
+            func.avg(case((is_quoted, quoted))),
+            func.avg(case((is_quoted, fee))),
+            func.avg(case((is_quoted, ((fee - quoted) / quoted) * 100))),
+        ).where(DealContribution.user_id == user_id)
+    ).one()
+    median_deal = median_by_group(session, fee, DealContribution.user_id == user_id).get(None)
+
+    platform_breakdown = _fee_breakdown(
+        session, user_id, DealContribution.platform, "platform", PLATFORM_LABELS
+    )
+    deal_type_breakdown = _fee_breakdown(
+        session, user_id, DealContribution.deal_type, "deal_type", DEAL_TYPE_LABELS
+    )
 
-    negotiations_by_id = {n.id: n for n in negotiations if n.id is not None}
-    linked_deals = [d for d in deals if d.negotiation_session_id]
-    uplifts = []
-    for deal in linked_deals:
-        negotiation = negotiations_by_id.get(deal.negotiation_session_id)
-        if not negotiation:
-            continue
-        if negotiation.brand_offer is None or negotiation.brand_offer <= 0:
-            continue
-        if negotiation.final_agreed_fee_usd is None:
-            continue
-        uplifts.append(
-            (
-                (float(negotiation.final_agreed_fee_usd) - float(negotiation.brand_offer))
-                / float(negotiation.brand_offer)
-            )
-            * 100
-        )
+    brand_offer = NegotiationSession.brand_offer
+    uplift = ((NegotiationSession.final_agreed_fee_usd - brand_offer) / brand_offer) * 100
+    linked_uplift = (
+        DealContribution.user_id == user_id,
+        DealContribution.negotiation_session_id == NegotiationSession.id,
+        NegotiationSession.user_id == user_id,
+        brand_offer > 0,
+        NegotiationSession.final_agreed_fee_usd.is_not(None),
+    )
+    uplift_count, avg_uplift = session.exec(
+        select(func.count(), func.avg(uplift)).where(*linked_uplift)
+    ).one()
+    median_uplift = median_by_group(session, uplift, *linked_uplift).get(None)
 
     outcome_counts: dict[str, int] = {}
-    for negotiation in negotiations:
-        outcome = (negotiation.outcome or "in_progress").strip().lower()
+    for outcome in negotiation_outcomes:
+        outcome = (outcome or "in_progress").strip().lower()
         outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
 
-    monthly_buckets: dict[tuple[int, int], list[float]] = {}
-    for deal in deals:
-        created_at = deal.created_at or datetime.utcnow()
-        key = (created_at.year, created_at.month)
-        monthly_buckets.setdefault(key, []).append(float(deal.total_fee_usd))
+    month_column = func.strftime("%Y-%m", DealContribution.created_at)
+    monthly_rows = session.exec(
+        select(month_column, func.count(), func.sum(DealContribution.total_fee_usd))
+        .where(DealContribution.user_id == user_id)
+        .group_by(month_column)
+        .order_by(month_column)
+    ).all()
 
     monthly_trend = []
-    for (year, month) in sorted(monthly_buckets.keys()):
-        fees = monthly_buckets[(year, month)]
-        fees_sorted = sorted(fees)
-        total = float(sum(fees_sorted))
-        count = len(fees_sorted)
+    for month_key, count, total in monthly_rows:
+        year, month = map(int, month_key.split("-"))
+        total = float(total or 0)
         monthly_trend.append(
             {
                 "year": year,
@@ -128,27 +114,29 @@ def build_user_analytics(session: Session, user_id: int) -> dict[str, Any]:
         )
 
     deals_summary = {
-        "deals_count": len(deals),
-        "total_revenue": float(sum(deal_fees_sorted)) if deal_fees_sorted else None,
-        "avg_deal": _safe_avg(deal_fees_sorted),
-        "median_deal": _safe_median(deal_fees_sorted),
-        "avg_quoted_fee": _safe_avg(quoted_fees),
-        "avg_closed_fee": _safe_avg(closed_fees),
-        "avg_close_vs_quote_pct": _safe_avg(close_vs_quote),
-        "quoted_count": len(quoted_rows),
+        "deals_count": deals_count,
+        "total_revenue": float(total_revenue) if total_revenue is not None else None,
+        "avg_deal": float(avg_deal) if avg_deal is not None else None,
+        "median_deal": median_deal,
+        "avg_quoted_fee": float(avg_quoted_fee) if avg_quoted_fee is not None else None,
+        "avg_closed_fee": float(avg_closed_fee) if avg_closed_fee is not None else None,
+        "avg_close_vs_quote_pct": (
+            float(avg_close_vs_quote) if avg_close_vs_quote is not None else None
+        ),
+        "quoted_count": quoted_count,
     }
 
     negotiation_summary = {
-        "negotiation_count": len(negotiations),
-        "avg_uplift_pct": _safe_avg(uplifts),
-        "median_uplift_pct": _safe_median(uplifts),
+        "negotiation_count": len(negotiation_outcomes),
+        "avg_uplift_pct": float(avg_uplift) if avg_uplift is not None else None,
+        "median_uplift_pct": median_uplift,
         "outcomes": outcome_counts,
     }
 
     flags = {
-        "has_deals": len(deals) > 0,
-        "has_quoted_vs_closed": len(quoted_rows) > 0,
-        "has_negotiation_uplift": len(uplifts) > 0,
+        "has_deals": deals_count > 0,
+        "has_quoted_vs_closed": quoted_count > 0,
+        "has_negotiation_uplift": uplift_count > 0,
     }
 
     return {
@@ -171,10 +159,22 @@ def _quarter_date_range(year: int, quarter: int) -> tuple[datetime, datetime]:
     return datetime(year, 10, 1), datetime(year, 12, 31, 23, 59, 59)
 
 
-def _summarize_deals(rows: list[DealContribution]) -> dict[str, Any]:
-    fees = [float(row.total_fee_usd) for row in rows if row.total_fee_usd is not None]
-    views = [row.reported_views or 0 for row in rows]
+def _summarize_deals(rows: list[Any], min_deals_for_report: int) -> dict[str, Any]:
+    if len(rows) < min_deals_for_report:
+        # Too few deals to summarize: only the fee range is reported, so views and
+        # the sorted summaries are skipped.
+        fees = [row.total_fee_usd for row in rows if row.total_fee_usd is not None]
+        return {
+            "deal_count": len(rows),
+            "avg_fee": None,
+            "median_fee": None,
+            "min_fee": min(fees, default=None),
+            "max_fee": max(fees, default=None),
+            "avg_cpm": None,
+            "median_cpm": None,
+        }
 
+    fees, views = fees_and_views(rows)
     fee_summary = summarize_fees_outlier_safe(fees)
     cpm_summary = summarize_cpm_outlier_safe(fees, views)
 
@@ -202,74 +202,38 @@ def build_quarterly_niche_stats(
     min_deals_for_report = 5
     start_date, end_date = _quarter_date_range(year, quarter)
 
-    statement = select(DealContribution).where(
-        DealContribution.share_in_index == True,
-        DealContribution.niche == niche_code,
-        DealContribution.created_at >= start_date,
-        DealContribution.created_at <= end_date,
-    )
-    if platform_code and platform_code != "all":
-        statement = statement.where(DealContribution.platform == platform_code)
-
-    rows = session.exec(statement).all()
-    fee_values = [float(row.total_fee_usd) for row in rows if row.total_fee_usd is not None]
-    fee_values_sorted = sorted(fee_values)
-
-    enough_data_for_report = len(rows) >= min_deals_for_report
-
-    if enough_data_for_report:
-        summary = _summarize_deals(rows)
-    else:
-        summary = {
-            "deal_count": len(rows),
-            "avg_fee": None,
-            "median_fee": None,
-            "min_fee": float(fee_values_sorted[0]) if fee_values_sorted else None,
-            "max_fee": float(fee_values_sorted[-1]) if fee_values_sorted else None,
-            "avg_cpm": None,
-            "median_cpm": None,
-        }
-
-    prev_quarter = None
     prev_year = year
     prev_quarter_num = quarter - 1
     if prev_quarter_num == 0:
         prev_quarter_num = 4
         prev_year = year - 1
-
     prev_start, prev_end = _quarter_date_range(prev_year, prev_quarter_num)
-    prev_statement = select(DealContribution).where(
+
+    # Both quarters are adjacent, so one range scan covers them; rows are split
+    # by date afterwards.
+    statement = select(
+        DealContribution.total_fee_usd,
+        DealContribution.reported_views,
+        DealContribution.created_at,
+    ).where(
         DealContribution.share_in_index == True,
         DealContribution.niche == niche_code,
         DealContribution.created_at >= prev_start,
-        DealContribution.created_at <= prev_end,
+        DealContribution.created_at <= end_date,
     )
     if platform_code and platform_code != "all":
-        prev_statement = prev_statement.where(DealContribution.platform == platform_code)
+        statement = statement.where(DealContribution.platform == platform_code)
+
+    rows = session.exec(statement).all()
+    current_rows = [row for row in rows if row.created_at >= start_date]
+    prev_rows = [row for row in rows if row.created_at <= prev_end]
 
-    prev_rows = session.exec(prev_statement).all()
+    enough_data_for_report = len(current_rows) >= min_deals_for_report
+    summary = _summarize_deals(current_rows, min_deals_for_report)
+
+    prev_quarter = None
     if prev_rows:
-        prev_fee_values = [
-            float(row.total_fee_usd) for row in prev_rows if row.total_fee_usd is not None
-        ]
-        prev_fee_values_sorted = sorted(prev_fee_values)
-        prev_enough = len(prev_rows) >= min_deals_for_report
-        if prev_enough:
-            prev_quarter = _summarize_deals(prev_rows)
-        else:
-            prev_quarter = {
-                "deal_count": len(prev_rows),
-                "avg_fee": None,
-                "median_fee": None,
-                "min_fee": float(prev_fee_values_sorted[0])
-                if prev_fee_values_sorted
-                else None,
-                "max_fee": float(prev_fee_values_sorted[-1])
-                if prev_fee_values_sorted
-                else None,
-                "avg_cpm": None,
-                "median_cpm": None,
-            }
+        prev_quarter = _summarize_deals(prev_rows, min_deals_for_report)
         prev_quarter.update({"year": prev_year, "quarter": prev_quarter_num})
 
     return {
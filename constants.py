@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import re
+import sys
+from functools import lru_cache, partial
 from typing import Iterable
 
 PLANS = {
@@ -26,6 +28,8 @@ PLANS = {
     },
 }
 
+PRO_PLANS = frozenset({"pro", "premium"})
+
 PLATFORMS = [
     ("youtube", "YouTube"),
     ("instagram", "Instagram"),
@@ -109,11 +113,29 @@ FOLLOWER_TIER_LABELS = dict(FOLLOWER_TIERS)
 DEAL_TYPE_LABELS = dict(DEAL_TYPES)
 CONTENT_FORMAT_LABELS = dict(CONTENT_FORMATS)
 
+_PLATFORM_ALLOWED = frozenset(PLATFORM_LABELS)
+_NICHE_ALLOWED = frozenset(NICHE_LABELS)
+_GEO_REGION_ALLOWED = frozenset(GEO_REGION_LABELS)
+_FOLLOWER_TIER_ALLOWED = frozenset(FOLLOWER_TIER_LABELS)
+_DEAL_TYPE_ALLOWED = frozenset(DEAL_TYPE_LABELS)
+_CONTENT_FORMAT_ALLOWED = frozenset(CONTENT_FORMAT_LABELS)
+
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+_SLUG_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+_SLUG_TRANS = str.maketrans({chr(c): "_" for c in range(128) if chr(c) not in _SLUG_CHARS})
+
 
+@lru_cache(maxsize=2048)
 def _slugify(value: str) -> str:
     value = value.strip().lower()
-    value = re.sub(r"[^a-z0-9]+", "_", value)
-    return re.sub(r"_+", "_", value).strip("_")
+    if value.isascii():
+        value = value.translate(_SLUG_TRANS)
+    else:
+        value = _NON_ALNUM_RE.sub("_", value)
+    while "__" in value:
+        value = value.replace("__", "_")
+    return value.strip("_")
 
 
 def _build_label_lookup(options: Iterable[tuple[str, str]]) -> dict[str, str]:
@@ -174,7 +196,7 @@ _FOLLOWER_TIER_LOOKUP = _build_label_lookup(FOLLOWER_TIERS)
 
 def normalize_choice(
     value: str | None,
-    allowed: set[str],
+    allowed: frozenset[str],
     lookup: dict[str, str],
     aliases: dict[str, str] | None = None,
     default: str = "other",
@@ -184,63 +206,86 @@ def normalize_choice(
     raw = value.strip().lower()
     if raw == "":
         return default
+    # Canonical codes are returned interned so they share the constants' objects.
     if raw in allowed:
-        return raw
+        return sys.intern(raw)
     if aliases and raw in aliases:
         return aliases[raw]
+    if raw.isascii() and raw.isalnum():
+        return lookup.get(raw, default)
     slug = _slugify(raw)
     if slug in allowed:
-        return slug
+        return sys.intern(slug)
     if aliases and slug in aliases:
         return aliases[slug]
-    if slug in lookup:
-        return lookup[slug]
-    return default
-
-
-def normalize_platform(value: str | None) -> str:
-    return normalize_choice(value, set(PLATFORM_LABELS.keys()), _PLATFORM_LOOKUP, _PLATFORM_ALIASES)
-
-
-def normalize_niche(value: str | None) -> str:
-    return normalize_choice(value, set(NICHE_LABELS.keys()), _NICHE_LOOKUP)
-
-
-def normalize_geo_region(value: str | None) -> str:
-    return normalize_choice(value, set(GEO_REGION_LABELS.keys()), _GEO_LOOKUP, _GEO_ALIASES)
-
-
-def normalize_deal_type(value: str | None) -> str:
-    return normalize_choice(value, set(DEAL_TYPE_LABELS.keys()), _DEAL_TYPE_LOOKUP)
-
-
-def normalize_content_format(value: str | None) -> str:
-    return normalize_choice(value, set(CONTENT_FORMAT_LABELS.keys()), _CONTENT_FORMAT_LOOKUP)
-
-
-def normalize_follower_tier(value: str | None) -> str:
-    return normalize_choice(value, set(FOLLOWER_TIER_LABELS.keys()), _FOLLOWER_TIER_LOOKUP, _FOLLOWER_TIER_ALIASES, default="under_5k")
+    return lookup.get(slug, default)
+
+
+@lru_cache(maxsize=2048)
+def parse_int(value: str | None) -> int | None:
+    if value is None or value.strip() == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=2048)
+def parse_float(value: str | None) -> float | None:
+    if value is None or value.strip() == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _cached_normalizer(**options):
+    # Inputs come from a small vocabulary of dropdown values, so results are memoized.
+    return lru_cache(maxsize=512)(partial(normalize_choice, **options))
+
+
+normalize_platform = _cached_normalizer(
+    allowed=_PLATFORM_ALLOWED, lookup=_PLATFORM_LOOKUP, aliases=_PLATFORM_ALIASES
+)
+normalize_niche = _cached_normalizer(allowed=_NICHE_ALLOWED, lookup=_NICHE_LOOKUP)
+normalize_geo_region = _cached_normalizer(
+    allowed=_GEO_REGION_ALLOWED, lookup=_GEO_LOOKUP, aliases=_GEO_ALIASES
+)
+normalize_deal_type = _cached_normalizer(
+    allowed=_DEAL_TYPE_ALLOWED, lookup=_DEAL_TYPE_LOOKUP
+)
+normalize_content_format = _cached_normalizer(
+    allowed=_CONTENT_FORMAT_ALLOWED, lookup=_CONTENT_FORMAT_LOOKUP
+)
+normalize_follower_tier = _cached_normalizer(
+    allowed=_FOLLOWER_TIER_ALLOWED,
+    lookup=_FOLLOWER_TIER_LOOKUP,
+    aliases=_FOLLOWER_TIER_ALIASES,
+    default="under_5k",
+)
 
 
 def platform_label(value: str | None) -> str:
-    return PLATFORM_LABELS.get(normalize_platform(value), "Other")
+    return PLATFORM_LABELS.get(value) or PLATFORM_LABELS.get(normalize_platform(value), "Other")
 
 
 def niche_label(value: str | None) -> str:
-    return NICHE_LABELS.get(normalize_niche(value), "Other")
+    return NICHE_LABELS.get(value) or NICHE_LABELS.get(normalize_niche(value), "Other")
 
 
 def geo_region_label(value: str | None) -> str:
-    return GEO_REGION_LABELS.get(normalize_geo_region(value), "Other")
+    return GEO_REGION_LABELS.get(value) or GEO_REGION_LABELS.get(normalize_geo_region(value), "Other")
 
 
 def follower_tier_label(value: str | None) -> str:
-    return FOLLOWER_TIER_LABELS.get(normalize_follower_tier(value), "Under 5K")
+    return FOLLOWER_TIER_LABELS.get(value) or FOLLOWER_TIER_LABELS.get(normalize_follower_tier(value), "Under 5K")
 
 
 def deal_type_label(value: str | None) -> str:
-    return DEAL_TYPE_LABELS.get(normalize_deal_type(value), "Other")
+    return DEAL_TYPE_LABELS.get(value) or DEAL_TYPE_LABELS.get(normalize_deal_type(value), "Other")
 
 
 def content_format_label(value: str | None) -> str:
-    return CONTENT_FORMAT_LABELS.get(normalize_content_format(value), "Other")
+    return CONTENT_FORMAT_LABELS.get(value) or CONTENT_FORMAT_LABELS.get(normalize_content_format(value), "Other")
@@ -1,33 +1,50 @@
 from __future__ import annotations
 
+import asyncio
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-import io
 import logging
+import multiprocessing
 import secrets
-from typing import Optional
+import time
+from typing import Annotated, Any, Optional
 
 import os
+import re
 
 from fastapi import Depends, FastAPI, Form, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import func
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+)
+from pydantic import BaseModel, field_validator
+from sqlalchemy import exists, func
 from sqlmodel import Session, select
 from sqlalchemy.exc import IntegrityError
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 import stripe
 
 from auth import (
+    CurrentUserOptional,
+    CurrentUserProfile,
     authenticate_user,
     get_current_user,
+    get_user_by_email,
     hash_password,
     login_user,
     logout_user,
     normalize_email,
 )
-from security import require_plan_or_redirect
+from security import plan_required, plan_required_with_profile
 from constants import (
     CONTENT_FORMATS,
     CONTENT_FORMAT_LABELS,
@@ -52,6 +69,8 @@ from constants import (
     normalize_geo_region,
     normalize_niche,
     normalize_platform,
+    parse_float,
+    parse_int,
     platform_label,
 )
 from models import (
@@ -65,13 +84,15 @@ from models import (
     create_deal_contribution_from_form,
     bucket_follower_count,
     get_or_create_creator_profile,
-    get_or_initialize_default_packages,
+    load_media_kit_bundle,
     get_recent_negotiations,
     get_session,
     link_negotiation_to_deal,
 )
 from analytics_helpers import build_quarterly_niche_stats, build_user_analytics
+from pdf_helpers import render_pdf_file
 from ai import (
+    NICHE_REPORT_UNAVAILABLE,
     build_creator_stats,
     generate_creator_insights,
     generate_niche_report,
@@ -80,11 +101,12 @@ from ai import (
     reserve_calculator_ai_call,
 )
 from stats_helpers import (
+    fees_and_views,
     get_bucket_community_pricing,
+    refresh_community_pricing_snapshot,
     summarize_cpm_outlier_safe,
     summarize_fees_outlier_safe,
 )
-from xhtml2pdf import pisa
 
 logger = logging.getLogger(__name__)
 
@@ -151,7 +173,19 @@ app.add_middleware(SecurityHeadersMiddleware)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-templates = Jinja2Templates(directory="templates")
+# Templates are compiled once per process and cached as bytecode across restarts;
+# set TEMPLATES_AUTO_RELOAD to pick up template edits without restarting.
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader("templates"),
+        # Plain-text templates (emails) must not be HTML-escaped.
+        autoescape=select_autoescape(
+            disabled_extensions=("txt",), default_for_string=True, default=True
+        ),
+        auto_reload=_env_true(os.environ.get("TEMPLATES_AUTO_RELOAD")),
+        bytecode_cache=FileSystemBytecodeCache(),
+    )
+)
 templates.env.globals.update(
     {
         "PLATFORMS": PLATFORMS,
@@ -215,6 +249,62 @@ def resolve_plan_from_price_id(
     return None
 
 
+_PLATFORM_CPM = {
+    "youtube": 15,
+    "instagram": 12,
+    "tiktok": 10,
+    "linkedin": 18,
+    "twitter": 11,
+    "twitch": 14,
+    "podcast": 20,
+    "newsletter": 16,
+    "other": 8,
+}
+
+# Keyed by normalized niche code; niches not listed here use 1.0.
+_NICHE_MULTIPLIERS = {
+    "finance": 1.4,
+    "business": 1.4,
+    "beauty": 1.2,
+    "fashion": 1.2,
+    "tech": 1.3,
+    "gaming": 1.3,
+    "fitness": 1.15,
+    "health": 1.15,
+}
+
+# Keyed by normalized geo region code; other regions use 1.0.
+_GEO_MULTIPLIERS = {
+    "us": 1.1,
+    "canada": 1.1,
+    "uk": 1.05,
+    "eu": 1.05,
+}
+
+
+def _rate_factors(
+    platform: str, niche: str, geo_region: str
+) -> tuple[float, float, float, float]:
+    base_cpm = _PLATFORM_CPM.get(platform, _PLATFORM_CPM["other"])
+    niche_multiplier = _NICHE_MULTIPLIERS.get(niche, 1.0)
+    geo_multiplier = _GEO_MULTIPLIERS.get(geo_region, 1.0)
+    return base_cpm, niche_multiplier, geo_multiplier, base_cpm * niche_multiplier
+
+
+# Every normalized (platform, niche, geo) combination, precomputed at import.
+_RATE_FACTORS = {
+    (platform, niche, geo_region): _rate_factors(platform, niche, geo_region)
+    for platform in PLATFORM_LABELS
+    for niche in NICHE_LABELS
+    for geo_region in GEO_REGION_LABELS
+}
+
+
+# Engagement rate (%) below 1, 1-3, 3-5, and 5+.
+_ENGAGEMENT_THRESHOLDS = (1, 3, 5)
+_ENGAGEMENT_MULTIPLIERS = (0.8, 1.0, 1.15, 1.3)
+
+
 def calculate_rate(
     platform: str,
     niche: str,
@@ -241,68 +331,30 @@ def calculate_rate(
                 high_multiplier = 1.05
         return center * low_multiplier, center * high_multiplier
 
-    platform_cpm = {
-        "youtube": 15,
-        "instagram": 12,
-        "tiktok": 10,
-        "linkedin": 18,
-        "twitter": 11,
-        "twitch": 14,
-        "podcast": 20,
-        "newsletter": 16,
-        "other": 8,
-    }
-    niche_multipliers = {
-        "finance": 1.4,
-        "investing": 1.4,
-        "business": 1.4,
-        "beauty": 1.2,
-        "fashion": 1.2,
-        "tech": 1.3,
-        "gaming": 1.3,
-        "fitness": 1.15,
-        "health": 1.15,
-    }
-
-    platform_key = normalize_platform(platform)
-    niche_key = normalize_niche(niche)
-
-    base_cpm = platform_cpm.get(platform_key, platform_cpm["other"])
-    niche_multiplier = 1.0
-    for key, value in niche_multipliers.items():
-        if key in niche_key:
-            niche_multiplier = value
-            break
+    base_cpm, niche_multiplier, geo_multiplier, niche_cpm = _RATE_FACTORS[
+        (normalize_platform(platform), normalize_niche(niche), normalize_geo_region(geo_region))
+    ]
 
     engagement_multiplier = 1.0
     if engagement_rate is not None:
-        if engagement_rate < 1:
-            engagement_multiplier = 0.8
-        elif engagement_rate < 3:
-            engagement_multiplier = 1.0
-        elif engagement_rate < 5:
-            engagement_multiplier = 1.15
-        else:
-            engagement_multiplier = 1.3
-
-    geo_key = normalize_geo_region(geo_region)
-    if geo_key in {"us", "canada"}:
-        geo_multiplier = 1.1
-    elif geo_key in {"uk", "eu"}:
-        geo_multiplier = 1.05
-    else:
-        geo_multiplier = 1.0
+        engagement_multiplier = _ENGAGEMENT_MULTIPLIERS[
+            bisect_right(_ENGAGEMENT_THRESHOLDS, engagement_rate)
+        ]
 
     views = avg_views if avg_views and avg_views > 0 else 0
     if views == 0 and followers and followers > 0:
         views = int(followers * 0.1)
 
-    effective_cpm = base_cpm * niche_multiplier * engagement_multiplier * geo_multiplier
-    central_price = (views / 1000) * effective_cpm if views else 0
-    low_price, high_price = price_band(central_price, engagement_rate)
-    recommended_price = round_price(central_price)
-    recommended_min = round_price(low_price)
-    recommended_max = round_price(high_price)
+    effective_cpm = niche_cpm * engagement_multiplier * geo_multiplier
+    if views:
+        central_price = (views / 1000) * effective_cpm
+        low_price, high_price = price_band(central_price, engagement_rate)
+        recommended_price = round_price(central_price)
+        recommended_min = round_price(low_price)
+        recommended_max = round_price(high_price)
+    else:
+        # No audience estimate: every price rounds to zero, so skip the band math.
+        recommended_price = recommended_min = recommended_max = 0.0
 
     return {
         "recommended_price": recommended_price,
@@ -320,33 +372,28 @@ def calculate_rate(
 @app.on_event("startup")
 def on_startup() -> None:
     create_db_and_tables()
+    # Compile every template up front so first requests skip the parse.
+    for name in templates.env.list_templates(extensions=["html", "txt"]):
+        templates.env.get_template(name)
 
 
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, session: Session = Depends(get_session)):
-    user_id = request.session.get("user_id")
-    user = session.get(User, user_id) if user_id else None
+def index(request: Request, user: CurrentUserOptional):
     return templates.TemplateResponse("index.html", {"request": request, "user": user})
 
 
 @app.get("/terms", response_class=HTMLResponse)
-def terms(request: Request, session: Session = Depends(get_session)):
-    user_id = request.session.get("user_id")
-    user = session.get(User, user_id) if user_id else None
+def terms(request: Request, user: CurrentUserOptional):
     return templates.TemplateResponse("terms.html", {"request": request, "user": user})
 
 
 @app.get("/privacy", response_class=HTMLResponse)
-def privacy(request: Request, session: Session = Depends(get_session)):
-    user_id = request.session.get("user_id")
-    user = session.get(User, user_id) if user_id else None
+def privacy(request: Request, user: CurrentUserOptional):
     return templates.TemplateResponse("privacy.html", {"request": request, "user": user})
 
 
 @app.get("/signup", response_class=HTMLResponse)
-def signup_form(request: Request, session: Session = Depends(get_session)):
-    user_id = request.session.get("user_id")
-    user = session.get(User, user_id) if user_id else None
+def signup_form(request: Request, user: CurrentUserOptional):
     return templates.TemplateResponse("signup.html", {"request": request, "user": user, "error": None})
 
 
@@ -368,30 +415,32 @@ def signup(
             status_code=400,
         )
 
-    existing = session.exec(
-        select(User).where(
-            (User.email == normalized_email) | (User.username == normalized_username)
+    # Check before hashing so duplicate signups skip the bcrypt cost; the unique
+    # constraints still catch a concurrent signup that slips past the check. Email
+    # is compared via lower(email), like login, so legacy mixed-case rows count.
+    taken = session.exec(
+        select(
+            exists().where(
+                (func.lower(User.email) == normalized_email)
+                | (User.username == normalized_username)
+            )
         )
-    ).first()
-    if existing:
-        return templates.TemplateResponse(
-            "signup.html",
-            {"request": request, "user": None, "error": "Email or username already exists."},
-            status_code=400,
+    ).one()
+    if not taken:
+        user = User(
+            email=normalized_email,
+            username=normalized_username,
+            hashed_password=hash_password(password),
+            onboarding_completed=False,
         )
-
-    user = User(
-        email=normalized_email,
-        username=normalized_username,
-        hashed_password=hash_password(password),
-        onboarding_completed=False,
-    )
-    session.add(user)
-    try:
-        session.commit()
-        session.refresh(user)
-    except IntegrityError:
-        session.rollback()
+        session.add(user)
+        try:
+            session.commit()
+            session.refresh(user)
+        except IntegrityError:
+            session.rollback()
+            taken = True
+    if taken:
         return templates.TemplateResponse(
             "signup.html",
             {
@@ -407,9 +456,7 @@ def signup(
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_form(request: Request, session: Session = Depends(get_session)):
-    user_id = request.session.get("user_id")
-    user = session.get(User, user_id) if user_id else None
+def login_form(request: Request, user: CurrentUserOptional):
     return templates.TemplateResponse("login.html", {"request": request, "user": user, "error": None})
 
 
@@ -441,9 +488,7 @@ def logout(request: Request):
 
 
 @app.get("/forgot-password", response_class=HTMLResponse)
-def forgot_password_form(request: Request, session: Session = Depends(get_session)):
-    user_id = request.session.get("user_id")
-    user = session.get(User, user_id) if user_id else None
+def forgot_password_form(request: Request, user: CurrentUserOptional):
     return templates.TemplateResponse(
         "forgot_password.html",
         {"request": request, "user": user, "message": None, "reset_url": None},
@@ -456,9 +501,7 @@ def forgot_password(
     email: str = Form(...),
     session: Session = Depends(get_session),
 ):
-    normalized_email = normalize_email(email)
-    statement = select(User).where(User.email == normalized_email)
-    user = session.exec(statement).first()
+    user = get_user_by_email(session, email)
 
     reset_url = None
     if user:
@@ -604,24 +647,6 @@ def onboarding_submit(
         session.commit()
         return RedirectResponse(url="/dashboard", status_code=303)
 
-    def to_int(value: str) -> int | None:
-        value = value.strip()
-        if not value:
-            return None
-        try:
-            return int(value)
-        except ValueError:
-            return None
-
-    def to_float(value: str) -> float | None:
-        value = value.strip()
-        if not value:
-            return None
-        try:
-            return float(value)
-        except ValueError:
-            return None
-
     profile = get_or_create_creator_profile(session, user.id)
     profile.display_name = display_name.strip() or profile.display_name
     profile.tagline = tagline.strip() or None
@@ -632,9 +657,9 @@ def onboarding_submit(
         if platform_code == "other"
         else None
     )
-    profile.followers = to_int(followers)
-    profile.avg_views = to_int(avg_views)
-    profile.engagement_rate = to_float(engagement_rate)
+    profile.followers = parse_int(followers)
+    profile.avg_views = parse_int(avg_views)
+    profile.engagement_rate = parse_float(engagement_rate)
     niche_code = normalize_niche(niche)
     profile.niche = niche_code
     profile.niche_other = niche_other.strip() or None if niche_code == "other" else None
@@ -661,14 +686,14 @@ def dashboard(
 
 
 @app.get("/insights", response_class=HTMLResponse)
-def insights(
+async def insights(
     request: Request,
     session: Session = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    stats = build_creator_stats(session, user.id)
-    is_free = (user.plan or "free").lower() == "free"
-    insights_result = generate_creator_insights(stats, preview=is_free)
+    stats = await run_in_threadpool(build_creator_stats, session, user.id)
+    is_free = user.plan_code == "free"
+    insights_result = await generate_creator_insights(stats, preview=is_free)
 
     deal_summary = stats.get("deal_summary") or {}
     platform_breakdown = deal_summary.get("platform_breakdown") or {}
@@ -703,30 +728,14 @@ def calculator(
     request: Request,
     user: User = Depends(get_current_user),
 ):
-    normalized_plan = (user.plan or "free").lower()
-    is_pro_or_premium = normalized_plan in {"pro", "premium"}
-    is_free_plan = normalized_plan == "free"
+    # Fields the blank form leaves unset are simply absent from the context.
     return templates.TemplateResponse(
         "calculator.html",
         {
             "request": request,
             "user": user,
-            "is_pro_or_premium": is_pro_or_premium,
-            "is_free_plan": is_free_plan,
-            "result": None,
-            "limit_reached": False,
-            "message": None,
-            "platform": None,
-            "niche": None,
-            "niche_other": None,
-            "deal_type": None,
-            "deal_type_other": None,
-            "followers": None,
-            "avg_views": None,
-            "engagement_rate": None,
+            "is_free_plan": user.plan_code == "free",
             "geo_region": "us",
-            "community_note": None,
-            "ai_explanation": None,
         },
     )
 
@@ -954,32 +963,9 @@ async def stripe_webhook(
 def media_kit_form(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user: User = Depends(plan_required(["pro", "premium"], "media-kit")),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["pro", "premium"], "media-kit")
-    if plan_redirect:
-        return plan_redirect
-    profile = get_or_create_creator_profile(session, user.id)
-    updated = False
-    normalized_platform = normalize_platform(profile.primary_platform)
-    if normalized_platform != profile.primary_platform:
-        profile.primary_platform = normalized_platform
-        updated = True
-    if profile.niche:
-        normalized_niche = normalize_niche(profile.niche)
-        if normalized_niche != profile.niche:
-            profile.niche = normalized_niche
-            updated = True
-    if profile.audience_location:
-        normalized_geo = normalize_geo_region(profile.audience_location)
-        if normalized_geo != profile.audience_location:
-            profile.audience_location = normalized_geo
-            updated = True
-    if updated:
-        session.add(profile)
-        session.commit()
-        session.refresh(profile)
-    packages = get_or_initialize_default_packages(session, user.id)
+    profile, packages = load_media_kit_bundle(session, user.id)
     return templates.TemplateResponse(
         "media_kit_form.html",
         {
@@ -996,30 +982,10 @@ def media_kit_form(
 async def media_kit_submit(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user: User = Depends(plan_required(["pro", "premium"], "media-kit")),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["pro", "premium"], "media-kit")
-    if plan_redirect:
-        return plan_redirect
-
-    def to_int(value: str | None) -> int | None:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return int(value)
-        except ValueError:
-            return None
-
-    def to_float(value: str | None) -> float | None:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return float(value)
-        except ValueError:
-            return None
-
     form = await request.form()
-    profile = get_or_create_creator_profile(session, user.id)
+    profile, packages = load_media_kit_bundle(session, user.id)
 
     profile.display_name = (form.get("display_name") or "").strip()
     profile.tagline = (form.get("tagline") or "").strip() or None
@@ -1029,9 +995,9 @@ async def media_kit_submit(
     profile.primary_platform_other = (
         primary_platform_other if primary_platform == "other" else None
     )
-    profile.followers = to_int(form.get("followers"))
-    profile.avg_views = to_int(form.get("avg_views"))
-    profile.engagement_rate = to_float(form.get("engagement_rate"))
+    profile.followers = parse_int(form.get("followers"))
+    profile.avg_views = parse_int(form.get("avg_views"))
+    profile.engagement_rate = parse_float(form.get("engagement_rate"))
     raw_niche = (form.get("niche") or "").strip()
     niche_other = (form.get("niche_other") or "").strip() or None
     if raw_niche:
@@ -1056,15 +1022,15 @@ async def media_kit_submit(
     profile.website_url = (form.get("website_url") or "").strip() or None
     profile.contact_email = (form.get("contact_email") or "").strip() or None
 
-    packages = get_or_initialize_default_packages(session, user.id)
     packages_by_id = {package.id: package for package in packages if package.id is not None}
     default_names = ["Basic", "Standard", "Premium"]
+    new_packages = []
 
     for index in range(3):
         package_id = form.get(f"packages-{index}-id")
         name = (form.get(f"packages-{index}-name") or default_names[index]).strip()
         headline = (form.get(f"packages-{index}-headline") or "").strip() or None
-        price = to_float(form.get(f"packages-{index}-price"))
+        price = parse_float(form.get(f"packages-{index}-price"))
         deliverables = (form.get(f"packages-{index}-deliverables") or "").strip() or None
         notes = (form.get(f"packages-{index}-notes") or "").strip() or None
 
@@ -1079,7 +1045,7 @@ async def media_kit_submit(
 
         if package is None:
             package = MediaKitPackage(user_id=user.id, sort_order=index)
-            session.add(package)
+            new_packages.append(package)
 
         package.name = name or default_names[index]
         package.headline = headline
@@ -1088,23 +1054,46 @@ async def media_kit_submit(
         package.notes = notes
         package.sort_order = index
 
+    # Profile changes, package updates and new packages go out in one flush.
+    session.add_all(new_packages)
     session.add(profile)
     session.commit()
     return RedirectResponse(url="/media-kit?saved=1", status_code=303)
 
 
+def _iter_file_chunks(file, chunk_size: int = 64 * 1024):
+    with file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+# pisa is pure Python and CPU-bound, so renders run in separate processes. The
+# pool is small and uses spawned workers: forking a threaded server is unsafe and
+# would copy the whole app into every child.
+def _new_pdf_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=min(2, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+_pdf_pool = _new_pdf_pool()
+
+
+@app.on_event("shutdown")
+def shutdown_pdf_pool() -> None:
+    _pdf_pool.shutdown(cancel_futures=True)
+
+
 @app.get("/media-kit/pdf")
-def media_kit_pdf(
+async def media_kit_pdf(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user: User = Depends(plan_required(["pro", "premium"], "media-kit")),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["pro", "premium"], "media-kit")
-    if plan_redirect:
-        return plan_redirect
-
-    profile = get_or_create_creator_profile(session, user.id)
-    packages = get_or_initialize_default_packages(session, user.id)
+    profile, packages = await run_in_threadpool(
+        load_media_kit_bundle, session, user.id
+    )
 
     html_content = templates.get_template("media_kit_pdf.html").render(
         {
@@ -1115,34 +1104,50 @@ def media_kit_pdf(
         }
     )
 
-    pdf_buffer = io.BytesIO()
-    result = pisa.CreatePDF(io.StringIO(html_content), dest=pdf_buffer)
-
-    if result.err:
-        logger.exception("Media kit PDF generation failed.")
+    global _pdf_pool
+    pool = _pdf_pool
+    try:
+        pdf_path = await asyncio.get_running_loop().run_in_executor(
+            pool, render_pdf_file, html_content
+        )
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed) and the executor refuses all further work;
+        # swap in a fresh one unless a concurrent request already has.
+        logger.exception("Media kit PDF worker pool broke; replacing it")
+        if _pdf_pool is pool:
+            _pdf_pool = _new_pdf_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+        pdf_path = None
+    except RuntimeError:
+        # The pool has been shut down along with the app.
+        logger.exception("Media kit PDF pool unavailable")
+        pdf_path = None
+
+    if pdf_path is None:
+        logger.error("Media kit PDF generation failed.")
         return HTMLResponse(
             "Sorry, we couldn’t generate your PDF right now. Please try again later.",
             status_code=500,
         )
 
-    pdf_buffer.seek(0)
+    # The open handle keeps the data readable after the path is removed.
+    pdf_file = open(pdf_path, "rb")
+    os.unlink(pdf_path)
     headers = {"Content-Disposition": 'attachment; filename="wortha-media-kit.pdf"'}
-    return StreamingResponse(pdf_buffer, media_type="application/pdf", headers=headers)
+    return StreamingResponse(
+        _iter_file_chunks(pdf_file), media_type="application/pdf", headers=headers
+    )
 
 
 @app.get("/negotiation", response_class=HTMLResponse)
 def negotiation_form(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    current: tuple[User, CreatorProfile | None] = Depends(
+        plan_required_with_profile(["premium"], "negotiation")
+    ),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["premium"], "negotiation")
-    if plan_redirect:
-        return plan_redirect
-
-    profile = session.exec(
-        select(CreatorProfile).where(CreatorProfile.user_id == user.id)
-    ).first()
+    user, profile = current
     recent_negotiations = get_recent_negotiations(session, user.id, limit=5)
 
     form_data = {}
@@ -1173,32 +1178,12 @@ def negotiation_form(
 async def negotiation_submit(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    current: tuple[User, CreatorProfile | None] = Depends(
+        plan_required_with_profile(["premium"], "negotiation")
+    ),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["premium"], "negotiation")
-    if plan_redirect:
-        return plan_redirect
-
-    def to_int(value: str | None) -> int | None:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return int(value)
-        except ValueError:
-            return None
-
-    def to_float(value: str | None) -> float | None:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return float(value)
-        except ValueError:
-            return None
-
+    user, profile = current
     form = await request.form()
-    profile = session.exec(
-        select(CreatorProfile).where(CreatorProfile.user_id == user.id)
-    ).first()
 
     brand_name = (form.get("brand_name") or "").strip()
     platform = normalize_platform(form.get("platform"))
@@ -1215,24 +1200,24 @@ async def negotiation_submit(
     content_format_other = (form.get("content_format_other") or "").strip() or None
     geo_region = normalize_geo_region(form.get("geo_region") or "us")
 
-    followers_value = to_int(form.get("followers"))
+    followers_value = parse_int(form.get("followers"))
     if followers_value is None and profile:
         followers_value = profile.followers
     followers_value = followers_value or 0
 
-    avg_views_value = to_int(form.get("avg_views"))
+    avg_views_value = parse_int(form.get("avg_views"))
     if avg_views_value is None and profile:
         avg_views_value = profile.avg_views
     if avg_views_value is None and followers_value:
         avg_views_value = int(followers_value * 0.1)
 
-    engagement_value = to_float(form.get("engagement_rate"))
+    engagement_value = parse_float(form.get("engagement_rate"))
     if engagement_value is None and profile:
         engagement_value = profile.engagement_rate
     if engagement_value is None:
         engagement_value = 3.0
 
-    brand_offer_value = to_float(form.get("brand_offer")) or 0.0
+    brand_offer_value = parse_float(form.get("brand_offer")) or 0.0
 
     result = calculate_rate(
         platform=platform,
@@ -1253,57 +1238,30 @@ async def negotiation_submit(
 
     if offer_vs_market_pct is None:
         assessment_text = "We couldn't estimate a fair market range from the provided metrics."
-    elif offer_vs_market_pct <= -30:
-        assessment_text = (
-            "This offer is more than 30% below our estimate of fair market value "
-            "for your metrics."
-        )
-    elif offer_vs_market_pct <= -10:
-        assessment_text = (
-            "This offer is below market value; there’s room to negotiate up."
-        )
-    elif offer_vs_market_pct <= 10:
-        assessment_text = (
-            "This offer is roughly in line with market value for your niche and audience."
-        )
-    else:
-        assessment_text = (
-            "This offer is above typical market value for your metrics."
-        )
-
-    # Simple counter strategy: anchor at mid-market and give a modest upper bound.
-    if market_mid > 0:
-        if offer_vs_market_pct is not None and offer_vs_market_pct <= -10:
-            recommended_counter_min = market_mid
-            recommended_counter_max = market_max * 1.1
-        else:
-            recommended_counter_min = market_mid * 0.9
-            recommended_counter_max = market_max * 1.05
-    else:
         recommended_counter_min = None
         recommended_counter_max = None
+    else:
+        # Simple counter strategy: anchor at mid-market and give a modest upper bound.
+        assessment_text, counter_min_factor, counter_max_factor = _OFFER_ASSESSMENTS[
+            bisect_left(_OFFER_PCT_THRESHOLDS, offer_vs_market_pct)
+        ]
+        recommended_counter_min = market_mid * counter_min_factor
+        recommended_counter_max = market_max * counter_max_factor
 
     counter_mid = None
     if recommended_counter_min is not None and recommended_counter_max is not None:
         counter_mid = (recommended_counter_min + recommended_counter_max) / 2
 
     email_subject = f"Re: Partnership with {brand_name}"
-    counter_line = (
-        f"A fair range for this collaboration would be ${recommended_counter_min:,.2f}–"
-        f"${recommended_counter_max:,.2f}, with a counter proposal of ${counter_mid:,.2f}."
-        if counter_mid is not None
-        else "I’d love to discuss a fair rate based on the scope and my audience metrics."
-    )
-    email_body = (
-        f"Hi {brand_name} team,\n\n"
-        "Thanks so much for the offer and for considering a partnership. "
-        f"Based on my audience metrics ({followers_value:,} followers, "
-        f"{avg_views_value or 0:,} average views) and my niche in {niche_label(niche) or 'this space'}, "
-        "typical market rates suggest a higher range.\n\n"
-        f"{counter_line}\n\n"
-        "Happy to discuss options and find a structure that works for both sides.\n\n"
-        "Best,\n"
-        f"{profile.display_name if profile else 'Creator'}"
+    email_body = templates.get_template("email/negotiation_counter.txt").render(
+        brand_name=brand_name,
+        followers=followers_value,
+        avg_views=avg_views_value,
+        niche_name=niche_label(niche),
+        counter_min=recommended_counter_min,
+        counter_max=recommended_counter_max,
+        counter_mid=counter_mid,
+        display_name=profile.display_name if profile else "Creator",
     )
 
     negotiation = NegotiationSession(
@@ -1332,8 +1290,9 @@ async def negotiation_submit(
     )
     session.add(negotiation)
     session.commit()
-    session.refresh(negotiation)
 
+    # The new session is the most recent, so this query also reloads it after the
+    # commit; a separate refresh() would be a redundant SELECT.
     recent_negotiations = get_recent_negotiations(session, user.id, limit=5)
     form_data = dict(form)
     form_data["platform"] = platform
@@ -1360,73 +1319,131 @@ async def negotiation_submit(
     )
 
 
+# Offer vs. market (%) at or below -30, -10 and 10, then above 10: the assessment
+# text and the factors applied to market mid/max for the counter range.
+_OFFER_PCT_THRESHOLDS = (-30, -10, 10)
+_OFFER_ASSESSMENTS = (
+    (
+        "This offer is more than 30% below our estimate of fair market value "
+        "for your metrics.",
+        1.0,
+        1.1,
+    ),
+    ("This offer is below market value; there’s room to negotiate up.", 1.0, 1.1),
+    (
+        "This offer is roughly in line with market value for your niche and audience.",
+        0.9,
+        1.05,
+    ),
+    ("This offer is above typical market value for your metrics.", 0.9, 1.05),
+)
+
+
+# Numeric calculator inputs; anything else (including "nan"/"inf") is treated as blank.
+_INT_RE = re.compile(r"[+-]?\d+")
+_FLOAT_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+class CalculatorForm(BaseModel):
+    platform: str
+    niche: str
+    deal_type: str
+    niche_other: Optional[str] = None
+    deal_type_other: Optional[str] = None
+    followers: Optional[int] = None
+    avg_views: Optional[int] = None
+    engagement_rate: Optional[float] = None
+    geo_region: Optional[str] = "us"
+
+    @field_validator("followers", "avg_views", mode="before")
+    @classmethod
+    def _blank_invalid_int(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip()
+            return value if _INT_RE.fullmatch(value) else None
+        return value
+
+    @field_validator("engagement_rate", mode="before")
+    @classmethod
+    def _blank_invalid_float(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip()
+            return value if _FLOAT_RE.fullmatch(value) else None
+        return value
+
+
+def _utc_month_window() -> tuple[datetime, datetime]:
+    # Naive UTC to match how Calculation.created_at is stored.
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return month_start, (month_start + timedelta(days=32)).replace(day=1)
+
+
+# Free-plan users known to have used this month's calculations, keyed to the
+# month start. Monthly counts only grow, so a hit here is safe to trust even
+# with several worker processes; otherwise the count is read from the database.
+_free_limit_reached: dict[int, datetime] = {}
+
+
+def _record_free_limit(user_id: int, month_start: datetime) -> None:
+    # Entries all share one month start, so a stale one means the month rolled
+    # over; dropping them then keeps the dict to this month's capped users.
+    if _free_limit_reached and next(iter(_free_limit_reached.values())) != month_start:
+        _free_limit_reached.clear()
+    _free_limit_reached[user_id] = month_start
+
+
+def _save_calculation(session: Session, calculation: Calculation, user: User) -> None:
+    session.add(calculation)
+    session.commit()
+    # Reload the expired user here so the template doesn't lazy-load it on the loop.
+    session.refresh(user)
+
+
 @app.post("/calculator", response_class=HTMLResponse)
-def calculator_submit(
+async def calculator_submit(
     request: Request,
-    platform: str = Form(...),
-    niche: str = Form(...),
-    deal_type: str = Form(...),
-    niche_other: Optional[str] = Form(None),
-    deal_type_other: Optional[str] = Form(None),
-    followers: Optional[str] = Form(None),
-    avg_views: Optional[str] = Form(None),
-    engagement_rate: Optional[str] = Form(None),
-    geo_region: Optional[str] = Form("us"),
+    form: Annotated[CalculatorForm, Form()],
     session: Session = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
     import html
 
-    def to_int(value: Optional[str]) -> Optional[int]:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return int(value)
-        except ValueError:
-            return None
-
-    def to_float(value: Optional[str]) -> Optional[float]:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return float(value)
-        except ValueError:
-            return None
-
-    followers_value = to_int(followers)
-    avg_views_value = to_int(avg_views)
-    engagement_value = to_float(engagement_rate)
+    followers_value = form.followers
+    avg_views_value = form.avg_views
+    engagement_value = form.engagement_rate
 
-    normalized_plan = (user.plan or "free").lower()
-    is_pro_or_premium = normalized_plan in {"pro", "premium"}
-    is_free_plan = normalized_plan == "free"
+    # Read once up front: the AI usage reservation commits the session, which would
+    # otherwise expire the user and reload it when the calculation is saved.
+    user_id = user.id
+    is_free_plan = user.plan_code == "free"
 
-    now = datetime.utcnow()
-    month_start = datetime(now.year, now.month, 1)
-    if now.month == 12:
-        next_month = datetime(now.year + 1, 1, 1)
-    else:
-        next_month = datetime(now.year, now.month + 1, 1)
+    month_start, next_month = _utc_month_window()
 
     if is_free_plan:
-        statement = (
-            select(func.count())
-            .select_from(Calculation)
-            .where(
-                Calculation.user_id == user.id,
-                Calculation.created_at >= month_start,
-                Calculation.created_at < next_month,
+        limit_reached = _free_limit_reached.get(user_id) == month_start
+        if not limit_reached:
+            statement = (
+                select(func.count())
+                .select_from(Calculation)
+                .where(
+                    Calculation.user_id == user_id,
+                    Calculation.created_at >= month_start,
+                    Calculation.created_at < next_month,
+                )
             )
-        )
-        month_count = session.exec(statement).one() or 0
+            month_count = await run_in_threadpool(
+                lambda: session.exec(statement).one() or 0
+            )
+            limit_reached = month_count >= 3
+            if limit_reached:
+                _record_free_limit(user_id, month_start)
 
-        if month_count >= 3:
+        if limit_reached:
             return templates.TemplateResponse(
                 "calculator.html",
                 {
                     "request": request,
                     "user": user,
-                    "is_pro_or_premium": is_pro_or_premium,
                     "is_free_plan": is_free_plan,
                     "result": None,
                     "limit_reached": True,
@@ -1437,13 +1454,13 @@ def calculator_submit(
                 },
             )
 
-    platform_code = normalize_platform(platform)
-    niche_code = normalize_niche(niche)
-    deal_type_code = normalize_deal_type(deal_type)
-    geo_region_code = normalize_geo_region(geo_region or "us")
+    platform_code = normalize_platform(form.platform)
+    niche_code = normalize_niche(form.niche)
+    deal_type_code = normalize_deal_type(form.deal_type)
+    geo_region_code = normalize_geo_region(form.geo_region or "us")
 
-    niche_other_value = (niche_other or "").strip() or None if niche_code == "other" else None
-    deal_type_other_value = (deal_type_other or "").strip() or None if deal_type_code == "other" else None
+    niche_other_value = (form.niche_other or "").strip() or None if niche_code == "other" else None
+    deal_type_other_value = (form.deal_type_other or "").strip() or None if deal_type_code == "other" else None
 
     result = calculate_rate(
         platform=platform_code,
@@ -1460,7 +1477,8 @@ def calculator_submit(
         follower_tier = normalize_follower_tier(bucket_follower_count(followers_value))
 
     if follower_tier:
-        community_pricing = get_bucket_community_pricing(
+        community_pricing = await run_in_threadpool(
+            get_bucket_community_pricing,
             session=session,
             platform=platform_code,
             niche=niche_code,
@@ -1521,9 +1539,11 @@ def calculator_submit(
     recommended_low = float(result["recommended_min"])
     recommended_high = float(result["recommended_max"])
 
-    if calculator_ai_enabled() and reserve_calculator_ai_call(session, "calculator"):
+    if calculator_ai_enabled() and await run_in_threadpool(
+        reserve_calculator_ai_call, session, "calculator"
+    ):
         try:
-            explanation = generate_pricing_explanation(
+            explanation = await generate_pricing_explanation(
                 platform=platform_name,
                 niche=niche_name,
                 deal_type=deal_type_name,
@@ -1562,7 +1582,7 @@ def calculator_submit(
         )
 
     calculation = Calculation(
-        user_id=user.id,
+        user_id=user_id,
         platform=platform_code,
         niche=niche_code,
         niche_other=niche_other_value,
@@ -1580,19 +1600,17 @@ def calculator_submit(
         geo_multiplier=result["geo_multiplier"],
         ai_explanation=explanation,
     )
-    session.add(calculation)
-    session.commit()
+    await run_in_threadpool(_save_calculation, session, calculation, user)
+    if is_free_plan and month_count + 1 >= 3:
+        _record_free_limit(user_id, month_start)
 
     return templates.TemplateResponse(
         "calculator.html",
         {
             "request": request,
             "user": user,
-            "is_pro_or_premium": is_pro_or_premium,
             "is_free_plan": is_free_plan,
             "result": result,
-            "limit_reached": False,
-            "message": None,
             "platform": platform_code,
             "niche": niche_code,
             "niche_other": niche_other_value,
@@ -1608,6 +1626,21 @@ def calculator_submit(
     )
 
 
+# Only the columns calculation_history.html reads; rows are not hydrated.
+_CALCULATION_HISTORY_COLUMNS = (
+    Calculation.created_at,
+    Calculation.platform,
+    Calculation.niche,
+    Calculation.deal_type,
+    Calculation.followers,
+    Calculation.avg_views,
+    Calculation.recommended_price,
+    Calculation.recommended_min,
+    Calculation.recommended_max,
+    Calculation.ai_explanation,
+)
+
+
 @app.get("/calculations", response_class=HTMLResponse)
 def calculation_history(
     request: Request,
@@ -1615,7 +1648,7 @@ def calculation_history(
     user: User = Depends(get_current_user),
 ):
     statement = (
-        select(Calculation)
+        select(*_CALCULATION_HISTORY_COLUMNS)
         .where(Calculation.user_id == user.id)
         .order_by(Calculation.created_at.desc())
         .limit(100)
@@ -1647,15 +1680,23 @@ def dev_set_plan(
     return RedirectResponse(url="/dashboard", status_code=303)
 
 
+# Submitted deal fields normalized to their canonical codes when present.
+_DEAL_FORM_NORMALIZERS = {
+    "platform": normalize_platform,
+    "niche": normalize_niche,
+    "geo_region": normalize_geo_region,
+    "deal_type": normalize_deal_type,
+    "content_format": normalize_content_format,
+}
+
+
 @app.get("/deals/new", response_class=HTMLResponse)
 def deal_new_form(
     request: Request,
+    current: CurrentUserProfile,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
 ):
-    profile = session.exec(
-        select(CreatorProfile).where(CreatorProfile.user_id == user.id)
-    ).first()
+    user, profile = current
     form_data = {}
     if profile:
         form_data = {
@@ -1681,13 +1722,11 @@ def deal_new_form(
 @app.post("/deals/new")
 async def deal_new_submit(
     request: Request,
+    current: CurrentUserProfile,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
 ):
+    user, profile = current
     form = await request.form()
-    profile = session.exec(
-        select(CreatorProfile).where(CreatorProfile.user_id == user.id)
-    ).first()
 
     form_data = dict(form)
     if profile:
@@ -1700,16 +1739,10 @@ async def deal_new_submit(
         if not form_data.get("platform") and profile.primary_platform:
             form_data["platform"] = profile.primary_platform
 
-    if form_data.get("platform"):
-        form_data["platform"] = normalize_platform(form_data.get("platform"))
-    if form_data.get("niche"):
-        form_data["niche"] = normalize_niche(form_data.get("niche"))
-    if form_data.get("geo_region"):
-        form_data["geo_region"] = normalize_geo_region(form_data.get("geo_region"))
-    if form_data.get("deal_type"):
-        form_data["deal_type"] = normalize_deal_type(form_data.get("deal_type"))
-    if form_data.get("content_format"):
-        form_data["content_format"] = normalize_content_format(form_data.get("content_format"))
+    for key, normalize in _DEAL_FORM_NORMALIZERS.items():
+        value = form_data.get(key)
+        if value:
+            form_data[key] = normalize(value)
 
     try:
         contribution = create_deal_contribution_from_form(session, user, form_data)
@@ -1735,6 +1768,17 @@ async def deal_new_submit(
             negotiation_id_int = None
         if negotiation_id_int:
             link_negotiation_to_deal(session, negotiation_id_int, contribution)
+    if contribution.share_in_index:
+        refresh_community_pricing_snapshot(
+            session,
+            contribution.platform,
+            contribution.niche,
+            contribution.follower_tier,
+            contribution.geo_region,
+        )
+    # The contribution, any negotiation link and the pricing snapshot are
+    # saved in one transaction.
+    session.commit()
 
     return RedirectResponse(url="/deals/new?saved=1", status_code=303)
 
@@ -1743,12 +1787,8 @@ async def deal_new_submit(
 def analytics_dashboard(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user: User = Depends(plan_required(["pro", "premium"], "analytics")),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["pro", "premium"], "analytics")
-    if plan_redirect:
-        return plan_redirect
-
     analytics = build_user_analytics(session, user.id)
     return templates.TemplateResponse(
         "analytics.html",
@@ -1761,21 +1801,37 @@ def analytics_dashboard(
 
 
 def _current_year_quarter() -> tuple[int, int]:
-    today = datetime.utcnow()
-    quarter = ((today.month - 1) // 3) + 1
-    return today.year, quarter
+    today = time.gmtime()
+    quarter = ((today.tm_mon - 1) // 3) + 1
+    return today.tm_year, quarter
+
+
+# Niche reports are the same for every viewer and only move as deals are
+# contributed, so each (niche, platform, year, quarter) is reused for a few
+# minutes instead of re-aggregating and re-calling the AI per request.
+_NICHE_REPORT_TTL_SECONDS = 300
+_NICHE_REPORT_CACHE_SIZE = 512
+_niche_report_cache: dict[tuple[str, str, int, int], tuple[float, dict, str | None]] = {}
+
+
+def _cache_niche_report(key, stats: dict, report_text: str | None) -> None:
+    _niche_report_cache.pop(key, None)
+    if len(_niche_report_cache) >= _NICHE_REPORT_CACHE_SIZE:
+        # Entries are kept in insertion order, so the first is the oldest.
+        del _niche_report_cache[next(iter(_niche_report_cache))]
+    _niche_report_cache[key] = (
+        time.monotonic() + _NICHE_REPORT_TTL_SECONDS,
+        stats,
+        report_text,
+    )
 
 
 @app.get("/reports/niche", response_class=HTMLResponse)
-def niche_report(
+async def niche_report(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user: User = Depends(plan_required(["premium"], "niche-reports")),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["premium"], "niche-reports")
-    if plan_redirect:
-        return plan_redirect
-
     niche = request.query_params.get("niche") or ""
     platform = request.query_params.get("platform") or "all"
 
@@ -1797,15 +1853,26 @@ def niche_report(
     normalized_platform = normalize_platform(platform) if platform != "all" else "all"
 
     if normalized_niche:
-        stats = build_quarterly_niche_stats(
-            session=session,
-            niche_code=normalized_niche,
-            platform_code=normalized_platform,
-            year=year,
-            quarter=quarter,
-        )
-        if stats.get("enough_data_for_report"):
-            report_text = generate_niche_report(stats)
+        cache_key = (normalized_niche, normalized_platform, year, quarter)
+        cached = _niche_report_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            _, stats, report_text = cached
+        else:
+            stats = await run_in_threadpool(
+                build_quarterly_niche_stats,
+                session=session,
+                niche_code=normalized_niche,
+                platform_code=normalized_platform,
+                year=year,
+                quarter=quarter,
+            )
+            if stats.get("enough_data_for_report"):
+                report_text = await generate_niche_report(stats)
+            # Only cache finished reports; failures and blank text retry next time.
+            if report_text is None or (
+                report_text.strip() and report_text != NICHE_REPORT_UNAVAILABLE
+            ):
+                _cache_niche_report(cache_key, stats, report_text)
 
     return templates.TemplateResponse(
         "niche_report.html",
@@ -1823,22 +1890,54 @@ def niche_report(
     )
 
 
+# Rate-index query filters, in display order, and their normalizers.
+_RATE_INDEX_FILTERS = {
+    "platform": normalize_platform,
+    "niche": normalize_niche,
+    "follower_tier": normalize_follower_tier,
+    "geo_region": normalize_geo_region,
+    "deal_type": normalize_deal_type,
+}
+
+
+# Rate-index timeframes as 30-day months; unknown values fall back to 6m.
+_TIMEFRAME_WINDOWS = {
+    "3m": timedelta(days=30 * 3),
+    "6m": timedelta(days=30 * 6),
+    "12m": timedelta(days=30 * 12),
+}
+
+
+# Only the columns rate_index.html and the summaries read; rows are not hydrated.
+_RATE_INDEX_COLUMNS = (
+    DealContribution.platform,
+    DealContribution.niche,
+    DealContribution.follower_tier,
+    DealContribution.geo_region,
+    DealContribution.deal_type,
+    DealContribution.content_format,
+    DealContribution.deliverables,
+    DealContribution.total_fee_usd,
+    DealContribution.reported_views,
+    DealContribution.created_at,
+)
+
+
 @app.get("/rate-index", response_class=HTMLResponse)
 def rate_index(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user: User = Depends(plan_required(["premium"], "rate-index")),
 ):
-    plan_redirect = require_plan_or_redirect(user, ["premium"], "rate-index")
-    if plan_redirect:
-        return plan_redirect
-
-    shared_count = session.exec(
-        select(DealContribution)
-        .where(DealContribution.user_id == user.id, DealContribution.share_in_index == True)
-        .limit(1)
-    ).all()
-    if not shared_count:
+    has_shared = session.exec(
+        select(
+            exists().where(
+                DealContribution.user_id == user.id,
+                DealContribution.share_in_index == True,
+            )
+        )
+    ).one()
+    if not has_shared:
         return templates.TemplateResponse(
             "rate_index.html",
             {
@@ -1848,39 +1947,28 @@ def rate_index(
             },
         )
 
-    platform = normalize_platform(request.query_params.get("platform") or "") if request.query_params.get("platform") else ""
-    niche = normalize_niche(request.query_params.get("niche") or "") if request.query_params.get("niche") else ""
-    follower_tier = normalize_follower_tier(request.query_params.get("follower_tier") or "") if request.query_params.get("follower_tier") else ""
-    geo_region = normalize_geo_region(request.query_params.get("geo_region") or "") if request.query_params.get("geo_region") else ""
-    deal_type = normalize_deal_type(request.query_params.get("deal_type") or "") if request.query_params.get("deal_type") else ""
+    filters = {}
+    for key, normalize in _RATE_INDEX_FILTERS.items():
+        value = request.query_params.get(key)
+        filters[key] = normalize(value) if value else ""
     timeframe = (request.query_params.get("timeframe") or "6m").strip()
 
-    statement = select(DealContribution).where(
+    statement = select(*_RATE_INDEX_COLUMNS).where(
         DealContribution.share_in_index == True,
         DealContribution.total_fee_usd > 0,
     )
 
     if timeframe != "all":
-        months_map = {"3m": 3, "6m": 6, "12m": 12}
-        months = months_map.get(timeframe, 6)
-        cutoff = datetime.utcnow() - timedelta(days=30 * months)
+        cutoff = datetime.utcnow() - _TIMEFRAME_WINDOWS.get(timeframe, _TIMEFRAME_WINDOWS["6m"])
         statement = statement.where(DealContribution.created_at >= cutoff)
 
-    if platform:
-        statement = statement.where(DealContribution.platform == platform)
-    if follower_tier:
-        statement = statement.where(DealContribution.follower_tier == follower_tier)
-    if geo_region:
-        statement = statement.where(DealContribution.geo_region == geo_region)
-    if niche:
-        statement = statement.where(DealContribution.niche == niche)
-    if deal_type:
-        statement = statement.where(DealContribution.deal_type == deal_type)
+    for key, value in filters.items():
+        if value:
+            statement = statement.where(getattr(DealContribution, key) == value)
 
     contributions = session.exec(statement.order_by(DealContribution.created_at.desc())).all()
 
-    fees = [float(row.total_fee_usd) for row in contributions if row.total_fee_usd is not None]
-    views = [row.reported_views or 0 for row in contributions]
+    fees, views = fees_and_views(contributions)
 
     fee_summary = summarize_fees_outlier_safe(fees)
     cpm_summary = summarize_cpm_outlier_safe(fees, views)
@@ -1894,13 +1982,6 @@ def rate_index(
             "contributions": contributions,
             "fee_summary": fee_summary,
             "cpm_summary": cpm_summary if cpm_summary["count"] > 0 else None,
-            "filters": {
-                "platform": platform,
-                "niche": niche,
-                "follower_tier": follower_tier,
-                "geo_region": geo_region,
-                "deal_type": deal_type,
-                "timeframe": timeframe,
-            },
+            "filters": {**filters, "timeframe": timeframe},
         },
     )
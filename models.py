@@ -1,22 +1,48 @@
 from __future__ import annotations
 
+from bisect import bisect_right
 from datetime import datetime
 import sqlite3
 from typing import Optional
 
+from sqlalchemy import Index, event
 from sqlmodel import Field, SQLModel, Session, create_engine, select
 
 from constants import (
+    PRO_PLANS,
     normalize_content_format,
     normalize_deal_type,
     normalize_follower_tier,
     normalize_geo_region,
     normalize_niche,
     normalize_platform,
+    parse_float,
+    parse_int,
 )
 
 DATABASE_URL = "sqlite:///wortha.db"
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    connect_args={"check_same_thread": False},
+    pool_size=10,
+    max_overflow=20,
+)
+
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record) -> None:
+    # WAL lets readers proceed while a write is in progress; busy_timeout makes
+    # concurrent writers wait for the lock instead of failing immediately.
+    # Pooled connections are long-lived, so a larger page cache (20 MB) and
+    # in-memory temp tables for sorts/window queries are worth keeping per connection.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
 
 class User(SQLModel, table=True):
@@ -32,8 +58,20 @@ class User(SQLModel, table=True):
     onboarding_completed: bool = Field(default=True, nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    @property
+    def plan_code(self) -> str:
+        return (self.plan or "free").lower()
+
+    @property
+    def is_pro_or_premium(self) -> bool:
+        return self.plan_code in PRO_PLANS
+
 
 class Calculation(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_calculation_user_id_created_at", "user_id", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     platform: str
@@ -56,9 +94,13 @@ class Calculation(SQLModel, table=True):
 
 
 class AiUsage(SQLModel, table=True):
+    __table_args__ = (
+        Index("ux_aiusage_usage_date_feature", "usage_date", "feature", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    usage_date: str = Field(index=True)
-    feature: str = Field(index=True)
+    usage_date: str
+    feature: str
     call_count: int = Field(default=0)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -146,6 +188,20 @@ class NegotiationSession(SQLModel, table=True):
 
 class DealContribution(SQLModel, table=True):
     __tablename__ = "deal_contribution"
+    __table_args__ = (
+        # Covers the community pricing refresh: bucket equality filters first,
+        # then the share flag and the fee it reads, so no table lookups are needed.
+        Index(
+            "ix_deal_contribution_bucket_fee",
+            "platform",
+            "niche",
+            "follower_tier",
+            "geo_region",
+            "share_in_index",
+            "total_fee_usd",
+        ),
+        Index("ix_deal_contribution_share_created_at", "share_in_index", "created_at"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
@@ -182,62 +238,56 @@ class DealContribution(SQLModel, table=True):
     share_in_index: bool = Field(default=True)
 
 
-def create_db_and_tables() -> None:
-    SQLModel.metadata.create_all(engine)
-    ensure_plan_column_exists()
-    ensure_billing_columns_exist()
-    ensure_user_optional_columns_exist()
-    ensure_optional_columns_exist()
+class CommunityPricingSnapshot(SQLModel, table=True):
+    # Fee summary per community pricing bucket, refreshed whenever a shared deal
+    # lands in it. geo_region is "" for the all-regions bucket.
+    __tablename__ = "community_pricing_snapshot"
 
+    platform: str = Field(primary_key=True)
+    niche: str = Field(primary_key=True)
+    follower_tier: str = Field(primary_key=True)
+    geo_region: str = Field(primary_key=True)
+    deal_count: int = 0
+    avg_fee: Optional[float] = None
+    median_fee: Optional[float] = None
+    min_fee: Optional[float] = None
+    max_fee: Optional[float] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-def ensure_plan_column_exists() -> None:
-    db_path = DATABASE_URL.replace("sqlite:///", "")
-    with sqlite3.connect(db_path) as connection:
-        cursor = connection.cursor()
-        cursor.execute("PRAGMA table_info(user)")
-        columns = {row[1] for row in cursor.fetchall()}
-        if "plan" not in columns:
-            cursor.execute(
-                "ALTER TABLE user ADD COLUMN plan TEXT NOT NULL DEFAULT 'free'"
-            )
-            connection.commit()
 
-
-def ensure_billing_columns_exist() -> None:
-    db_path = DATABASE_URL.replace("sqlite:///", "")
-    with sqlite3.connect(db_path) as connection:
-        cursor = connection.cursor()
-        cursor.execute("PRAGMA table_info(user)")
-        columns = {row[1] for row in cursor.fetchall()}
-        if "stripe_customer_id" not in columns:
-            cursor.execute("ALTER TABLE user ADD COLUMN stripe_customer_id TEXT")
-        if "stripe_subscription_id" not in columns:
-            cursor.execute("ALTER TABLE user ADD COLUMN stripe_subscription_id TEXT")
-        connection.commit()
+# Stored in the database's PRAGMA user_version once every step below has run.
+# Bump it whenever a step is added so existing databases pick the step up.
+SCHEMA_VERSION = 6
 
 
-def ensure_user_optional_columns_exist() -> None:
-    db_path = DATABASE_URL.replace("sqlite:///", "")
-    with sqlite3.connect(db_path) as connection:
-        cursor = connection.cursor()
-        cursor.execute("PRAGMA table_info(user)")
-        columns = {row[1] for row in cursor.fetchall()}
-        if "reset_token" not in columns:
-            cursor.execute("ALTER TABLE user ADD COLUMN reset_token TEXT")
-        if "reset_token_expires_at" not in columns:
-            cursor.execute(
-                "ALTER TABLE user ADD COLUMN reset_token_expires_at TIMESTAMP"
-            )
-        if "onboarding_completed" not in columns:
-            cursor.execute(
-                "ALTER TABLE user ADD COLUMN onboarding_completed INTEGER NOT NULL DEFAULT 1"
-            )
-        connection.commit()
+def create_db_and_tables() -> None:
+    with engine.connect() as connection:
+        if connection.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION:
+            return
+    SQLModel.metadata.create_all(engine)
+    ensure_optional_columns_exist()
+    ensure_ai_usage_unique_index_exists()
+    ensure_user_email_lower_index_exists()
+    ensure_calculation_user_created_index_exists()
+    ensure_deal_contribution_bucket_index_exists()
+    ensure_deal_contribution_share_created_index_exists()
+    ensure_creator_profile_codes_normalized()
+    ensure_community_pricing_snapshots_built()
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 
 def ensure_optional_columns_exist() -> None:
     db_path = DATABASE_URL.replace("sqlite:///", "")
     table_columns = {
+        "user": {
+            "plan": "TEXT NOT NULL DEFAULT 'free'",
+            "stripe_customer_id": "TEXT",
+            "stripe_subscription_id": "TEXT",
+            "reset_token": "TEXT",
+            "reset_token_expires_at": "TIMESTAMP",
+            "onboarding_completed": "INTEGER NOT NULL DEFAULT 1",
+        },
         "calculation": {
             "niche_other": "TEXT",
             "deal_type_other": "TEXT",
@@ -281,6 +331,104 @@ def ensure_optional_columns_exist() -> None:
         connection.commit()
 
 
+def ensure_ai_usage_unique_index_exists() -> None:
+    db_path = DATABASE_URL.replace("sqlite:///", "")
+    with sqlite3.connect(db_path) as connection:
+        cursor = connection.cursor()
+        # Older databases may hold duplicate daily rows from the previous
+        # select-then-insert path; keep the newest one so the index can be built.
+        cursor.execute(
+            "DELETE FROM aiusage WHERE id NOT IN "
+            "(SELECT MAX(id) FROM aiusage GROUP BY usage_date, feature)"
+        )
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_aiusage_usage_date_feature "
+            "ON aiusage (usage_date, feature)"
+        )
+        # The composite index serves every (usage_date, feature) lookup.
+        cursor.execute("DROP INDEX IF EXISTS ix_aiusage_usage_date")
+        cursor.execute("DROP INDEX IF EXISTS ix_aiusage_feature")
+        connection.commit()
+
+
+def ensure_user_email_lower_index_exists() -> None:
+    db_path = DATABASE_URL.replace("sqlite:///", "")
+    with sqlite3.connect(db_path) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_user_email_lower ON user (lower(email))"
+        )
+        connection.commit()
+
+
+def ensure_calculation_user_created_index_exists() -> None:
+    db_path = DATABASE_URL.replace("sqlite:///", "")
+    with sqlite3.connect(db_path) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_calculation_user_id_created_at "
+            "ON calculation (user_id, created_at)"
+        )
+        connection.commit()
+
+
+def ensure_deal_contribution_bucket_index_exists() -> None:
+    db_path = DATABASE_URL.replace("sqlite:///", "")
+    with sqlite3.connect(db_path) as connection:
+        cursor = connection.cursor()
+        cursor.execute("DROP INDEX IF EXISTS ix_deal_contribution_bucket")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_deal_contribution_bucket_fee "
+            "ON deal_contribution "
+            "(platform, niche, follower_tier, geo_region, share_in_index, total_fee_usd)"
+        )
+        connection.commit()
+
+
+def ensure_deal_contribution_share_created_index_exists() -> None:
+    db_path = DATABASE_URL.replace("sqlite:///", "")
+    with sqlite3.connect(db_path) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_deal_contribution_share_created_at "
+            "ON deal_contribution (share_in_index, created_at)"
+        )
+        connection.commit()
+
+
+def ensure_creator_profile_codes_normalized() -> None:
+    db_path = DATABASE_URL.replace("sqlite:///", "")
+    with sqlite3.connect(db_path) as connection:
+        cursor = connection.cursor()
+        rows = cursor.execute(
+            "SELECT id, primary_platform, niche, audience_location FROM creator_profile"
+        ).fetchall()
+        updates = []
+        for profile_id, platform, niche, location in rows:
+            normalized = (
+                normalize_platform(platform),
+                normalize_niche(niche) if niche else niche,
+                normalize_geo_region(location) if location else location,
+            )
+            if normalized != (platform, niche, location):
+                updates.append((*normalized, profile_id))
+        cursor.executemany(
+            "UPDATE creator_profile "
+            "SET primary_platform = ?, niche = ?, audience_location = ? WHERE id = ?",
+            updates,
+        )
+        connection.commit()
+
+
+def ensure_community_pricing_snapshots_built() -> None:
+    # Deferred import: stats_helpers builds on the models defined here.
+    from stats_helpers import rebuild_community_pricing_snapshots
+
+    with Session(engine) as session:
+        rebuild_community_pricing_snapshots(session)
+        session.commit()
+
+
 def get_session():
     with Session(engine) as session:
         yield session
@@ -310,15 +458,9 @@ def get_or_create_creator_profile(session: Session, user_id: int) -> CreatorProf
     return profile
 
 
-def get_or_initialize_default_packages(
-    session: Session, user_id: int
-) -> list[MediaKitPackage]:
-    statement = (
-        select(MediaKitPackage)
-        .where(MediaKitPackage.user_id == user_id)
-        .order_by(MediaKitPackage.sort_order)
-    )
-    existing = session.exec(statement).all()
+def _add_missing_default_packages(
+    session: Session, user_id: int, existing: list[MediaKitPackage]
+) -> bool:
     existing_by_name = {package.name.lower(): package for package in existing}
     defaults = [("Basic", 0), ("Standard", 1), ("Premium", 2)]
     created_any = False
@@ -337,10 +479,48 @@ def get_or_initialize_default_packages(
         session.add(package)
         created_any = True
 
-    if created_any:
+    return created_any
+
+
+def _packages_statement(user_id: int):
+    return (
+        select(MediaKitPackage)
+        .where(MediaKitPackage.user_id == user_id)
+        .order_by(MediaKitPackage.sort_order)
+    )
+
+
+def get_or_initialize_default_packages(
+    session: Session, user_id: int
+) -> list[MediaKitPackage]:
+    statement = _packages_statement(user_id)
+    existing = session.exec(statement).all()
+    if _add_missing_default_packages(session, user_id, existing):
         session.commit()
+        return session.exec(statement).all()
+    return existing
 
-    return session.exec(statement).all()
+
+def load_media_kit_bundle(
+    session: Session, user_id: int
+) -> tuple[CreatorProfile, list[MediaKitPackage]]:
+    # Profile and packages in one round trip; the create paths only run for new users.
+    rows = session.exec(
+        select(CreatorProfile, MediaKitPackage)
+        .outerjoin(MediaKitPackage, MediaKitPackage.user_id == CreatorProfile.user_id)
+        .where(CreatorProfile.user_id == user_id)
+        .order_by(MediaKitPackage.sort_order)
+    ).all()
+    if not rows:
+        profile = get_or_create_creator_profile(session, user_id)
+        return profile, get_or_initialize_default_packages(session, user_id)
+
+    profile = rows[0][0]
+    packages = [package for _, package in rows if package is not None]
+    if _add_missing_default_packages(session, user_id, packages):
+        session.commit()
+        packages = session.exec(_packages_statement(user_id)).all()
+    return profile, packages
 
 
 def get_recent_negotiations(
@@ -355,47 +535,33 @@ def get_recent_negotiations(
     return session.exec(statement).all()
 
 
+# Follower counts below 5k, 5k-10k, 10k-25k, 25k-50k, 50k-100k, and 100k+.
+_FOLLOWER_TIER_THRESHOLDS = (5_000, 10_000, 25_000, 50_000, 100_000)
+_FOLLOWER_TIERS = ("under_5k", "5k_10k", "10k_25k", "25k_50k", "50k_100k", "100k_plus")
+
+
 def bucket_follower_count(followers: int | None) -> str:
-    if followers is None or followers <= 0:
+    if followers is None:
         return "under_5k"
-    if followers < 5_000:
-        return "under_5k"
-    if followers < 10_000:
-        return "5k_10k"
-    if followers < 25_000:
-        return "10k_25k"
-    if followers < 50_000:
-        return "25k_50k"
-    if followers < 100_000:
-        return "50k_100k"
-    return "100k_plus"
+    return _FOLLOWER_TIERS[bisect_right(_FOLLOWER_TIER_THRESHOLDS, followers)]
+
+
+def _form_text(form_data: dict, key: str) -> str | None:
+    value = form_data.get(key)
+    if not value:
+        return None
+    return value.strip() or None
 
 
 def create_deal_contribution_from_form(
     session: Session, user: User, form_data: dict
 ) -> DealContribution:
-    def to_int(value: str | None) -> int | None:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return int(value)
-        except ValueError:
-            return None
-
-    def to_float(value: str | None) -> float | None:
-        if value is None or value.strip() == "":
-            return None
-        try:
-            return float(value)
-        except ValueError:
-            return None
-
-    total_fee = to_float(form_data.get("total_fee_usd"))
+    total_fee = parse_float(form_data.get("total_fee_usd"))
     if total_fee is None or total_fee <= 0:
         raise ValueError("total_fee_usd must be provided and greater than 0.")
 
-    follower_count = to_int(form_data.get("follower_count"))
-    negotiation_session_id = to_int(form_data.get("negotiation_session_id"))
+    follower_count = parse_int(form_data.get("follower_count"))
+    negotiation_session_id = parse_int(form_data.get("negotiation_session_id"))
     if negotiation_session_id is not None and negotiation_session_id <= 0:
         negotiation_session_id = None
     geo_region = normalize_geo_region(form_data.get("geo_region"))
@@ -406,9 +572,9 @@ def create_deal_contribution_from_form(
     deal_type_code = normalize_deal_type(form_data.get("deal_type"))
     content_format_code = normalize_content_format(form_data.get("content_format"))
 
-    niche_other = (form_data.get("niche_other") or "").strip() or None
-    deal_type_other = (form_data.get("deal_type_other") or "").strip() or None
-    content_format_other = (form_data.get("content_format_other") or "").strip() or None
+    niche_other = _form_text(form_data, "niche_other")
+    deal_type_other = _form_text(form_data, "deal_type_other")
+    content_format_other = _form_text(form_data, "content_format_other")
     outcome_raw = (form_data.get("outcome") or "").strip().lower()
     if outcome_raw not in {"won", "lost", "pending", "other"}:
         outcome_raw = "won"
@@ -425,38 +591,31 @@ def create_deal_contribution_from_form(
         deal_type_other=deal_type_other if deal_type_code == "other" else None,
         content_format=content_format_code,
         content_format_other=content_format_other if content_format_code == "other" else None,
-        deliverables=(form_data.get("deliverables") or "").strip() or None,
-        usage_rights=(form_data.get("usage_rights") or "").strip() or None,
-        duration_days=to_int(form_data.get("duration_days")),
+        deliverables=_form_text(form_data, "deliverables"),
+        usage_rights=_form_text(form_data, "usage_rights"),
+        duration_days=parse_int(form_data.get("duration_days")),
         total_fee_usd=total_fee,
-        quoted_fee_usd=to_float(form_data.get("quoted_fee_usd")),
-        cash_fee_usd=to_float(form_data.get("cash_fee_usd")),
-        non_cash_value_usd=to_float(form_data.get("non_cash_value_usd")),
+        quoted_fee_usd=parse_float(form_data.get("quoted_fee_usd")),
+        cash_fee_usd=parse_float(form_data.get("cash_fee_usd")),
+        non_cash_value_usd=parse_float(form_data.get("non_cash_value_usd")),
         is_exclusive=form_data.get("is_exclusive") in {"true", "on", "1", True},
-        reported_views=to_int(form_data.get("reported_views")),
-        reported_clicks=to_int(form_data.get("reported_clicks")),
-        brand_name=(form_data.get("brand_name") or "").strip() or None,
+        reported_views=parse_int(form_data.get("reported_views")),
+        reported_clicks=parse_int(form_data.get("reported_clicks")),
+        brand_name=_form_text(form_data, "brand_name"),
         negotiation_session_id=negotiation_session_id,
         outcome=outcome_raw,
         share_in_index=form_data.get("share_in_index") not in {"false", "0"},
     )
     session.add(contribution)
-    session.commit()
-    session.refresh(contribution)
     return contribution
 
 
 def link_negotiation_to_deal(
     session: Session, negotiation_id: int, deal: DealContribution
 ) -> None:
-    negotiation = session.exec(
-        select(NegotiationSession).where(NegotiationSession.id == negotiation_id)
-    ).first()
+    negotiation = session.get(NegotiationSession, negotiation_id)
     if not negotiation:
         return
     deal.negotiation_session_id = negotiation_id
     negotiation.final_agreed_fee_usd = deal.total_fee_usd
     negotiation.outcome = negotiation.outcome or "accepted"
-    session.add(deal)
-    session.add(negotiation)
-    session.commit()
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+import tempfile
+
+from xhtml2pdf import pisa
+
+logger = logging.getLogger(__name__)
+
+
+def render_pdf_file(html_content: str) -> str | None:
+    # Runs in a PDF worker process, which imports only this module rather than
+    # the app. The PDF is handed back by path so large files never have to be
+    # pickled across the process boundary.
+    pdf_file = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        with pdf_file:
+            result = pisa.CreatePDF(io.StringIO(html_content), dest=pdf_file)
+    except Exception:
+        logger.exception("Media kit PDF render raised")
+        os.unlink(pdf_file.name)
+        return None
+    if result.err:
+        os.unlink(pdf_file.name)
+        return None
+    return pdf_file.name
@@ -1,20 +1,43 @@
 from __future__ import annotations
 
-from fastapi import HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi import Depends, HTTPException
+
+from auth import get_current_user, get_current_user_and_profile
+from models import CreatorProfile, User
 
 
 def require_plan(user, allowed_plans: list[str]) -> None:
-    plan = (user.plan or "free").lower()
-    if plan not in allowed_plans:
+    if user.plan_code not in allowed_plans:
         raise HTTPException(
             status_code=403,
             detail="Your plan does not include access to this feature.",
         )
 
 
-def require_plan_or_redirect(user, allowed_plans: list[str], reason: str) -> None | RedirectResponse:
-    plan = (user.plan or "free").lower()
-    if plan not in allowed_plans:
-        return RedirectResponse(url=f"/upgrade?reason={reason}", status_code=303)
-    return None
+def _redirect_to_upgrade(user: User, allowed_plans: list[str], reason: str) -> None:
+    if user.plan_code not in allowed_plans:
+        raise HTTPException(
+            status_code=303, headers={"Location": f"/upgrade?reason={reason}"}
+        )
+
+
+def plan_required(allowed_plans: list[str], reason: str):
+    # Redirects to the upgrade page before the handler runs (or reads a form body),
+    # the same way get_current_user redirects anonymous users to /login.
+    def dependency(user: User = Depends(get_current_user)) -> User:
+        _redirect_to_upgrade(user, allowed_plans, reason)
+        return user
+
+    return dependency
+
+
+def plan_required_with_profile(allowed_plans: list[str], reason: str):
+    def dependency(
+        current: tuple[User, CreatorProfile | None] = Depends(
+            get_current_user_and_profile
+        ),
+    ) -> tuple[User, CreatorProfile | None]:
+        _redirect_to_upgrade(current[0], allowed_plans, reason)
+        return current
+
+    return dependency
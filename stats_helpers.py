@@ -1,88 +1,268 @@
 from __future__ import annotations
 
-from statistics import median
-from typing import Any
+from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, TypedDict
 
+from sqlalchemy import Integer, and_, case, cast, func, literal
 from sqlmodel import Session, select
 
-from models import DealContribution
+from models import CommunityPricingSnapshot, DealContribution
+
+_get_fee = attrgetter("total_fee_usd")
+_get_views = attrgetter("reported_views")
+
+
+class OutlierSafeSummary(TypedDict):
+    count: int
+    avg: float | None
+    median: float | None
+    min: float | None
+    max: float | None
+
+
+def _empty_summary() -> OutlierSafeSummary:
+    return {"count": 0, "avg": None, "median": None, "min": None, "max": None}
 
 
 def _safe_avg(values: list[float]) -> float | None:
     if not values:
         return None
-    return float(sum(values) / len(values))
+    return sum(values) / len(values)
 
 
-def _safe_median(values: list[float]) -> float | None:
-    if not values:
+def _sorted_median(values_sorted: list[float]) -> float | None:
+    if not values_sorted:
         return None
-    return float(median(values))
+    mid = len(values_sorted) // 2
+    if len(values_sorted) % 2:
+        return float(values_sorted[mid])
+    return (values_sorted[mid - 1] + values_sorted[mid]) / 2
+
+
+def median_by_group(
+    session: Session, value, *criteria, group_by=None
+) -> dict[Any, float]:
+    bucket = group_by if group_by is not None else literal(None)
+    ranked = (
+        select(
+            bucket.label("bucket"),
+            value.label("value"),
+            func.row_number().over(partition_by=group_by, order_by=value).label("rn"),
+            func.count().over(partition_by=group_by).label("cnt"),
+        )
+        .where(value.is_not(None), *criteria)
+        .subquery()
+    )
+    # Average the middle one (odd count) or two (even count) rows of each bucket.
+    statement = (
+        select(ranked.c.bucket, func.avg(ranked.c.value))
+        .where(ranked.c.rn * 2 >= ranked.c.cnt, ranked.c.rn * 2 <= ranked.c.cnt + 2)
+        .group_by(ranked.c.bucket)
+    )
+    return {
+        bucket_key: float(median_value)
+        for bucket_key, median_value in session.exec(statement).all()
+    }
+
+
+def summarize_outlier_safe_by_group(
+    session: Session, value, *criteria, group_by=()
+) -> dict[tuple, OutlierSafeSummary]:
+    # Same result as summarize_fees_outlier_safe for every group, in one query.
+    partition = list(group_by) or None
+    ranked = (
+        select(
+            *(column.label(f"key_{i}") for i, column in enumerate(group_by)),
+            value.label("value"),
+            func.row_number().over(partition_by=partition, order_by=value).label("rn"),
+            func.count().over(partition_by=partition).label("cnt"),
+        )
+        .where(value.is_not(None), *criteria)
+        .subquery()
+    )
+    bounds = select(
+        *(ranked.c[f"key_{i}"] for i in range(len(group_by))),
+        ranked.c.value,
+        ranked.c.rn,
+        case((ranked.c.cnt < 5, 0), else_=cast(ranked.c.cnt * 0.1, Integer)).label("lo"),
+        case((ranked.c.cnt < 5, ranked.c.cnt), else_=cast(ranked.c.cnt * 0.9, Integer)).label("hi"),
+    ).subquery()
+    keys = [bounds.c[f"key_{i}"] for i in range(len(group_by))]
+    in_clip = and_(bounds.c.rn > bounds.c.lo, bounds.c.rn <= bounds.c.hi)
+    # Middle one or two rows of the clipped window, as in median_by_group.
+    offset = bounds.c.rn - bounds.c.lo
+    width = bounds.c.hi - bounds.c.lo
+    in_middle = and_(in_clip, offset * 2 >= width, offset * 2 <= width + 2)
+    statement = select(
+        *keys,
+        func.count(),
+        func.min(bounds.c.value),
+        func.max(bounds.c.value),
+        func.avg(case((in_clip, bounds.c.value))),
+        func.avg(case((in_middle, bounds.c.value))),
+    ).group_by(*keys)
+
+    summaries = {}
+    for row in session.exec(statement).all():
+        count, min_value, max_value, avg_value, median_value = row[len(keys):]
+        if not count:
+            continue
+        summaries[tuple(row[: len(keys)])] = {
+            "count": count,
+            "avg": float(avg_value),
+            "median": float(median_value),
+            "min": float(min_value),
+            "max": float(max_value),
+        }
+    return summaries
+
+
+def summarize_outlier_safe_in_sql(session: Session, value, *criteria) -> OutlierSafeSummary:
+    return summarize_outlier_safe_by_group(session, value, *criteria).get(
+        (), _empty_summary()
+    )
 
 
-def _clip_outliers(values: list[float]) -> list[float]:
-    if len(values) < 5:
-        return values
-    values_sorted = sorted(values)
-    n = len(values_sorted)
+@lru_cache(maxsize=256)
+def _clip_bounds(n: int) -> tuple[int, int]:
+    # Slice bounds that drop the bottom and top 10%; small inputs are kept whole.
+    if n < 5:
+        return 0, n
     lower_idx = int(n * 0.1)
     upper_idx = int(n * 0.9)
     if upper_idx <= lower_idx:
+        return 0, n
+    return lower_idx, upper_idx
+
+
+def _clip_outliers(values_sorted: list[float]) -> list[float]:
+    lower_idx, upper_idx = _clip_bounds(len(values_sorted))
+    if upper_idx - lower_idx == len(values_sorted):
         return values_sorted
-    clipped = values_sorted[lower_idx:upper_idx]
-    return clipped if clipped else values_sorted
+    return values_sorted[lower_idx:upper_idx]
 
 
-def summarize_fees_outlier_safe(values: list[float]) -> dict[str, Any]:
-    if not values:
-        return {
-            "count": 0,
-            "avg": None,
-            "median": None,
-            "min": None,
-            "max": None,
-        }
+def _summarize_sorted(values_sorted: list[float]) -> OutlierSafeSummary:
+    if not values_sorted:
+        return _empty_summary()
 
-    values_sorted = sorted(values)
+    # Sorted once here; clipping is a slice and the median reads the middle.
     clipped = _clip_outliers(values_sorted)
 
     return {
         "count": len(values_sorted),
         "avg": _safe_avg(clipped),
-        "median": _safe_median(clipped),
+        "median": _sorted_median(clipped),
         "min": float(values_sorted[0]),
         "max": float(values_sorted[-1]),
     }
 
 
-def summarize_cpm_outlier_safe(fees: list[float], views: list[int]) -> dict[str, Any]:
-    cpms = []
-    for fee, view in zip(fees, views):
-        if view is None or view <= 0:
-            continue
-        if fee is None:
-            continue
-        cpms.append((float(fee) / float(view)) * 1000)
-
-    if not cpms:
-        return {
-            "count": 0,
-            "avg": None,
-            "median": None,
-            "min": None,
-            "max": None,
-        }
+def fees_and_views(rows) -> tuple[list[float], list[int]]:
+    fees = [fee for fee in map(_get_fee, rows) if fee is not None]
+    views = [views or 0 for views in map(_get_views, rows)]
+    return fees, views
 
-    cpms_sorted = sorted(cpms)
-    clipped = _clip_outliers(cpms_sorted)
 
-    return {
-        "count": len(cpms_sorted),
-        "avg": _safe_avg(clipped),
-        "median": _safe_median(clipped),
-        "min": float(cpms_sorted[0]),
-        "max": float(cpms_sorted[-1]),
-    }
+def summarize_fees_outlier_safe(values: list[float]) -> OutlierSafeSummary:
+    return _summarize_sorted(sorted(values))
+
+
+def summarize_cpm_outlier_safe(fees: list[float], views: list[int]) -> OutlierSafeSummary:
+    cpms = [
+        (fee / view) * 1000
+        for fee, view in zip(fees, views)
+        if view is not None and view > 0 and fee is not None
+    ]
+    return _summarize_sorted(sorted(cpms))
+
+
+def _snapshot_geo_key(geo_region: str | None) -> str:
+    # Missing and "other" regions are priced against every region in the bucket.
+    return geo_region if geo_region and geo_region != "other" else ""
+
+
+def _store_pricing_snapshot(
+    session: Session,
+    platform: str,
+    niche: str,
+    follower_tier: str,
+    geo_key: str,
+    summary: OutlierSafeSummary,
+) -> None:
+    session.merge(
+        CommunityPricingSnapshot(
+            platform=platform,
+            niche=niche,
+            follower_tier=follower_tier,
+            geo_region=geo_key,
+            deal_count=summary["count"],
+            avg_fee=summary["avg"],
+            median_fee=summary["median"],
+            min_fee=summary["min"],
+            max_fee=summary["max"],
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+def refresh_community_pricing_snapshot(
+    session: Session,
+    platform: str,
+    niche: str,
+    follower_tier: str,
+    geo_region: str | None,
+) -> None:
+    for geo_key in {_snapshot_geo_key(geo_region), ""}:
+        criteria = [
+            DealContribution.share_in_index == True,
+            DealContribution.platform == platform,
+            DealContribution.niche == niche,
+            DealContribution.follower_tier == follower_tier,
+            DealContribution.total_fee_usd > 0,
+        ]
+        if geo_key:
+            criteria.append(DealContribution.geo_region == geo_key)
+        summary = summarize_outlier_safe_in_sql(
+            session, DealContribution.total_fee_usd, *criteria
+        )
+        _store_pricing_snapshot(
+            session, platform, niche, follower_tier, geo_key, summary
+        )
+
+
+def rebuild_community_pricing_snapshots(session: Session) -> None:
+    # Every bucket in two grouped queries: all regions, then each specific region.
+    fee = DealContribution.total_fee_usd
+    criteria = (
+        DealContribution.share_in_index == True,
+        DealContribution.niche.is_not(None),
+        fee > 0,
+    )
+    bucket = (
+        DealContribution.platform,
+        DealContribution.niche,
+        DealContribution.follower_tier,
+    )
+    all_regions = summarize_outlier_safe_by_group(
+        session, fee, *criteria, group_by=bucket
+    )
+    for (platform, niche, follower_tier), summary in all_regions.items():
+        _store_pricing_snapshot(session, platform, niche, follower_tier, "", summary)
+
+    by_region = summarize_outlier_safe_by_group(
+        session,
+        fee,
+        *criteria,
+        DealContribution.geo_region.not_in(("", "other")),
+        group_by=(*bucket, DealContribution.geo_region),
+    )
+    for (platform, niche, follower_tier, geo_region), summary in by_region.items():
+        _store_pricing_snapshot(
+            session, platform, niche, follower_tier, geo_region, summary
+        )
 
 
 def get_bucket_community_pricing(
@@ -93,27 +273,17 @@ def get_bucket_community_pricing(
     geo_region: str | None = None,
     min_deals: int = 5,
 ) -> dict[str, Any] | None:
-    statement = select(DealContribution).where(
-        DealContribution.share_in_index == True,
-        DealContribution.platform == platform,
-        DealContribution.niche == niche,
-        DealContribution.follower_tier == follower_tier,
-        DealContribution.total_fee_usd > 0,
+    snapshot = session.get(
+        CommunityPricingSnapshot,
+        (platform, niche, follower_tier, _snapshot_geo_key(geo_region)),
     )
-    if geo_region and geo_region != "other":
-        statement = statement.where(DealContribution.geo_region == geo_region)
-
-    rows = session.exec(statement).all()
-    fees = [float(row.total_fee_usd) for row in rows if row.total_fee_usd is not None]
-
-    if len(fees) < min_deals:
+    if snapshot is None or snapshot.deal_count < min_deals:
         return None
 
-    summary = summarize_fees_outlier_safe(fees)
     return {
-        "deal_count": summary["count"],
-        "avg_fee": summary["avg"],
-        "median_fee": summary["median"],
-        "min_fee": summary["min"],
-        "max_fee": summary["max"],
+        "deal_count": snapshot.deal_count,
+        "avg_fee": snapshot.avg_fee,
+        "median_fee": snapshot.median_fee,
+        "min_fee": snapshot.min_fee,
+        "max_fee": snapshot.max_fee,
     }